@@ -0,0 +1,191 @@
+"""
+This script runs scraper.py and plotter.py for many subreddits and years
+in a single process, so the libraries and the kaleido instances are only
+started once for all of them.
+
+    $ python batch.py Python:2021 learnpython:2021 -o reports
+    $ python batch.py -m jobs.txt -o reports
+
+The manifest file has one job per line (e.g. Python,2021), empty lines and
+lines starting with # are ignored. Each job is saved in its own folder
+(e.g. reports/Python-2021/) and a report.json with the result of each job
+is saved in the output folder.
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import plotter
+import scraper
+from dataset import find_data, load_totals
+
+
+# argparse object creation
+arg = argparse.ArgumentParser(description="Collects and plots many subreddits data")
+arg.add_argument("jobs",
+                 nargs="*",
+                 help=" jobs in the subreddit:year format")
+arg.add_argument("-m", "--manifest",
+                 type=str,
+                 default=None,
+                 help=" file with one subreddit,year job per line")
+arg.add_argument("-o", "--output",
+                 type=str,
+                 default="reports",
+                 help=" folder where the folders of the jobs are created")
+arg.add_argument("-j", "--workers",
+                 type=int,
+                 default=4,
+                 help=" number of worker processes used to download and to export the images")
+arg.add_argument("--skip-scrape",
+                 action="store_true",
+                 help=" only creates the plots, using the data already in the job folders")
+arg.add_argument("-u", "--update",
+                 action="store_true",
+                 help=" only downloads the posts newer than the ones already in the job folders")
+arg.add_argument("-f", "--format",
+                 choices=["csv", "npy"],
+                 default="csv",
+                 help=" format of the data files")
+arg.add_argument("-w", "--window",
+                 choices=["month", "week", "day"],
+                 default="month",
+                 help=" size of the time windows the year is split into")
+arg.add_argument("--epoch",
+                 action="store_true",
+                 help=" saves the created_utc epochs instead of ISO dates in the CSV files")
+arg.add_argument("--tz",
+                 type=str,
+                 default="UTC",
+                 help=" timezone of the plots, needs --epoch or -f npy (the ISO dates are in the local time of the scraper)")
+arg.add_argument("--rate-limit",
+                 type=int,
+                 default=60,
+                 help=" maximum number of requests per minute")
+arg.add_argument("--engine",
+                 choices=["pmaw", "async"],
+                 default="pmaw",
+                 help=" download engine of the scraper")
+arg.add_argument("--endpoint",
+                 type=str,
+                 default=None,
+                 help=" base URL of a Pushshift compatible server")
+
+
+def parse_job(text):
+    """
+    This function converts a job like 'Python:2021' or 'Python,2021' to a (subreddit, year) tuple.
+    """
+
+    subreddit, year = text.replace(",", ":").split(":")
+
+    return subreddit.strip(), int(year)
+
+
+def read_manifest(path):
+    """
+    This function reads the jobs from a manifest file.
+    """
+
+    jobs = list()
+
+    with open(path, encoding="utf-8") as manifest:
+        for line in manifest:
+            line = line.strip()
+
+            if line and not line.startswith("#"):
+                jobs.append(parse_job(line))
+
+    return jobs
+
+
+def run_job(subreddit, year, args, scrape_executor, plot_executor):
+    """
+    This function downloads and plots a single job inside its own folder.
+    """
+
+    folder = os.path.join(args.output, f"{subreddit}-{year}")
+
+    if not args.skip_scrape:
+        options = ["-r", subreddit, "-yr", str(year), "-o", folder,
+                   "-f", args.format, "-w", args.window, "-j", str(args.workers),
+                   "--rate-limit", str(args.rate_limit), "--engine", args.engine]
+
+        if args.update:
+            options.append("-u")
+
+        if args.epoch:
+            options.append("--epoch")
+
+        if args.endpoint:
+            options.extend(["--endpoint", args.endpoint])
+
+        scraper.main(scraper.arg.parse_args(options), scrape_executor)
+
+    plot_args = plotter.arg.parse_args(
+        ["-r", subreddit, "-yr", str(year), "-d", folder, "-o", folder, "-j", str(args.workers),
+         "--tz", args.tz])
+
+    totals = load_totals(find_data(subreddit, year, folder), year, args.tz)
+    plotter.render(totals, plot_args, plot_executor)
+
+
+def main(args):
+
+    jobs = [parse_job(job) for job in args.jobs]
+
+    if args.manifest:
+        jobs.extend(read_manifest(args.manifest))
+
+    os.makedirs(args.output, exist_ok=True)
+
+    report = list()
+
+    # Both pools live for the whole batch, the plot workers keep kaleido running between jobs.
+    with ProcessPoolExecutor(max_workers=args.workers) as scrape_executor, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=plotter.start_worker) as plot_executor:
+
+        for subreddit, year in jobs:
+            start = time.perf_counter()
+
+            # A failed job is reported and the batch continues with the next one.
+            try:
+                run_job(subreddit, year, args, scrape_executor, plot_executor)
+                status, error = "ok", None
+            except Exception as exc:
+                status, error = "failed", f"{type(exc).__name__}: {exc}"
+
+            seconds = time.perf_counter() - start
+
+            print(f"[{status}] r/{subreddit} {year} ({seconds:,.1f}s){': ' + error if error else ''}")
+
+            report.append({
+                "subreddit": subreddit,
+                "year": year,
+                "status": status,
+                "seconds": round(seconds, 3),
+                "error": error
+            })
+
+    with open(os.path.join(args.output, "report.json"), "w", encoding="utf-8") as json_file:
+        json.dump(report, json_file, indent=4)
+
+    failed = sum(job["status"] != "ok" for job in report)
+    print(f"{len(report) - failed} of {len(report)} jobs finished successfully")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+
+    args = arg.parse_args()
+
+    # The ISO dates are in the local time of the scraper, they can't be converted to another timezone.
+    if args.tz != "UTC" and args.format == "csv" and not args.epoch and not args.skip_scrape:
+        arg.error("--tz needs UTC epochs in the data files, pass --epoch or -f npy")
+
+    sys.exit(main(args))
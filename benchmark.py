@@ -0,0 +1,282 @@
+"""
+This script measures the performance of the scraper and the plotter
+using randomly generated data.
+
+    $ python benchmark.py --sizes 10k,1M --output results.json
+
+The generated CSV files are saved in the data folder and reused by later runs.
+The results are printed and optionally saved as JSON, so they can be compared
+between versions of the scripts and its dependencies.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import plotly
+
+import plotter
+import scraper
+from dataset import (DAY, HOUR, activity, aggregate, count_hours, iter_timestamps, load_minutes, load_posts,
+                     load_timestamps, memory_footprint, top_authors, top_terms, year_bounds)
+
+
+# argparse object creation
+arg = argparse.ArgumentParser(description="Benchmarks the scraper and the plotter")
+arg.add_argument("-s", "--sizes",
+                 type=str,
+                 default="10k,1M",
+                 help=" comma separated number of rows of the generated datasets, e.g. 10k,1M,10M")
+arg.add_argument("-yr", "--yr",
+                 type=int,
+                 default=2021,
+                 help=" year of the generated posts")
+arg.add_argument("-n", "--repeat",
+                 type=int,
+                 default=3,
+                 help=" number of times each benchmark is run")
+arg.add_argument("-d", "--data",
+                 type=str,
+                 default="benchmark-data",
+                 help=" folder where the generated datasets are saved")
+arg.add_argument("-o", "--output",
+                 type=str,
+                 default=None,
+                 help=" JSON file where the results are saved")
+arg.add_argument("--export",
+                 action="store_true",
+                 help=" also benchmarks the image export (requires kaleido and Chrome)")
+
+
+# Words used to create the titles of the generated posts.
+WORDS = ["python", "code", "help", "how", "to", "the", "a", "with", "in", "data",
+         "pandas", "numpy", "error", "function", "list", "class", "my", "first",
+         "project", "web", "django", "flask", "script", "question", "best", "way",
+         "learn", "beginner", "file", "loop", "api", "library", "package", "is",
+         "why", "does", "not", "work", "using", "for", "and", "of", "new", "release"]
+
+
+def parse_size(text):
+    """
+    This function converts sizes like 10k or 1M to integers.
+    """
+
+    multipliers = {"k": 1_000, "m": 1_000_000}
+    text = text.strip().lower()
+
+    if text[-1] in multipliers:
+        return int(float(text[:-1]) * multipliers[text[-1]])
+
+    return int(text)
+
+
+def generate_submissions(rows, year, subreddit="Python", seed=0):
+    """
+    This function generates a DataFrame of random posts with realistic patterns:
+    more posts on weekdays and during the day, a few very active authors and
+    titles made of common words. It has the same columns as the CSV files of scraper.py.
+    """
+
+    rng = np.random.default_rng(seed)
+    start, end = year_bounds(year)
+
+    # We give each day and each hour a weight, weekends get less posts
+    # and the hours follow a daily cycle with its peak in the afternoon.
+    days = np.arange((end - start) // DAY)
+    day_weights = np.where((days + 3) % 7 >= 5, 0.7, 1.0)
+    hour_weights = 1.0 + 0.6 * np.sin((np.arange(24) - 9) / 24 * 2 * np.pi)
+
+    day = rng.choice(days, rows, p=day_weights / day_weights.sum())
+    hour = rng.choice(24, rows, p=hour_weights / hour_weights.sum())
+    second = rng.integers(0, HOUR, rows)
+
+    timestamps = np.sort(start + day * DAY + hour * HOUR + second)[::-1]
+
+    # A Zipf distribution gives us a few authors with many posts and a long tail.
+    authors = rng.zipf(1.5, rows) % max(rows // 5, 1)
+
+    # We create a pool of titles and pick from it, creating one per row is too slow.
+    pool = [" ".join(rng.choice(WORDS, rng.integers(3, 12))).capitalize() for _ in range(10_000)]
+    titles = np.array(pool, dtype=object)[rng.integers(0, len(pool), rows)]
+
+    ids = [np.base_repr(number, 36).lower() for number in range(10_000_000, 10_000_000 + rows)]
+
+    return pd.DataFrame({
+        "isodate": pd.to_datetime(timestamps, unit="s"),
+        "author": pd.Series(authors).map("user_{}".format),
+        "title": titles,
+        "permalink": [f"https://www.reddit.com/r/{subreddit}/comments/{post_id}/" for post_id in ids]
+    })
+
+
+def generate_csv(path, rows, year):
+    """
+    This function saves a generated dataset to a CSV file, unless it already exists.
+    """
+
+    if os.path.exists(path):
+        return
+
+    df = generate_submissions(rows, year)
+    df.to_csv(path, index=False, date_format="%Y-%m-%d %H:%M:%S")
+
+
+def fake_items(df):
+    """
+    This function yields the rows of a generated dataset the same way
+    PushshiftAPI.search_submissions() does.
+    """
+
+    timestamps = df["isodate"].to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+    for timestamp, author, title, permalink in zip(timestamps.tolist(), df["author"], df["title"], df["permalink"]):
+        yield {
+            "id": permalink.rstrip("/").rsplit("/", 1)[1],
+            "created_utc": timestamp,
+            "author": author,
+            "title": title,
+            "permalink": permalink[len("https://www.reddit.com"):]
+        }
+
+
+class FakePushshiftAPI:
+    """
+    This class replaces PushshiftAPI in scraper.py, it returns the posts of a DataFrame.
+    """
+
+    df = None
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def search_submissions(self, **kwargs):
+        return fake_items(self.df)
+
+
+def measure(func, repeat):
+    """
+    This function runs func several times and returns the timings in seconds.
+    """
+
+    timings = list()
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+
+    return timings
+
+
+def main(args):
+
+    os.makedirs(args.data, exist_ok=True)
+
+    results = list()
+
+    def record(name, rows, func):
+        """
+        This function runs a benchmark and saves its result, errors are saved too.
+        """
+
+        try:
+            timings = measure(func, args.repeat)
+        except Exception as exc:
+            # Only the first line of the message, some of them are very long.
+            message = (str(exc).strip().splitlines() or [""])[0]
+            result = {"name": name, "rows": rows, "error": f"{type(exc).__name__}: {message}"}
+        else:
+            result = {
+                "name": name,
+                "rows": rows,
+                "min": min(timings),
+                "median": statistics.median(timings),
+                "timings": timings
+            }
+
+        results.append(result)
+
+        if "error" in result:
+            print(f"{name:<24} {rows:>12,} rows   error: {result['error']}")
+        else:
+            print(f"{name:<24} {rows:>12,} rows   {result['min']:>10.4f}s (min)   {result['median']:>10.4f}s (median)")
+
+    for size in args.sizes.split(","):
+        rows = parse_size(size)
+        path = os.path.join(args.data, f"Benchmark-{args.yr}-{rows}.csv")
+
+        start = time.perf_counter()
+        generate_csv(path, rows, args.yr)
+        print(f"Dataset with {rows:,} rows ready in {time.perf_counter() - start:,.1f}s")
+
+        timestamps = load_timestamps(path)
+        hourly = count_hours(timestamps, args.yr)
+        totals = aggregate(hourly, args.yr)
+        totals["authors"] = top_authors(path)
+        totals["terms"] = top_terms(path)
+        totals["activity"] = activity(totals["hourly"])
+
+        record("load", rows, lambda: load_timestamps(path))
+        record("aggregate", rows, lambda: aggregate(count_hours(timestamps, args.yr), args.yr))
+        record("count_hours_chunked", rows, lambda: sum(count_hours(chunk, args.yr) for chunk in iter_timestamps(path)))
+        record("top_authors", rows, lambda: top_authors(path))
+        record("top_terms", rows, lambda: top_terms(path))
+        record("activity_minutes", rows, lambda: activity(load_minutes(path, args.yr)))
+        record("load_posts", rows, lambda: load_posts(path, compact=False))
+        record("load_posts_compact", rows, lambda: load_posts(path))
+
+        # The memory used by all the columns, with Python strings and with the compact dtypes.
+        full = int(memory_footprint(load_posts(path, compact=False))["total"])
+        compact = int(memory_footprint(load_posts(path))["total"])
+
+        results.append({"name": "posts_footprint", "rows": rows, "bytes": full, "compact_bytes": compact})
+        print(f"{'posts_footprint':<24} {rows:>12,} rows   {full / 1024 / 1024:>10.1f}MB (strings)   "
+              f"{compact / 1024 / 1024:>10.1f}MB (compact)")
+
+        with tempfile.TemporaryDirectory() as folder:
+            plot_args = plotter.arg.parse_args(["-r", "Benchmark", "-yr", str(args.yr), "-o", folder])
+
+            for name, (func, key, filename) in plotter.PLOTS.items():
+                record(f"build_{name}", rows, lambda: func(totals[key], plot_args))
+
+                if args.export:
+                    fig = func(totals[key], plot_args)
+                    record(f"export_{name}", rows, lambda: fig.write_image(os.path.join(folder, filename)))
+
+            # The scraper benchmarks use the generated rows instead of the Pushshift API.
+            df = pd.read_csv(path, parse_dates=["isodate"])
+            scraper_args = scraper.arg.parse_args(["-r", "Benchmark", "-yr", str(args.yr), "-o", folder, "--no-cache"])
+
+            record("scraper_to_row", rows, lambda: [scraper.to_row(item) for item in fake_items(df)])
+
+            FakePushshiftAPI.df = df
+            scraper.PushshiftAPI = FakePushshiftAPI
+
+            since, until = year_bounds(args.yr)
+            record("scraper_fetch_window", rows,
+                   lambda: scraper.fetch_window(tempfile.mkdtemp(dir=folder), since, until, scraper_args))
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "plotly": plotly.__version__,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as json_file:
+            json.dump(report, json_file, indent=4)
+
+
+if __name__ == "__main__":
+
+    main(arg.parse_args())
@@ -0,0 +1,357 @@
+"""
+This script creates plots that compare the activity of several subreddits
+during the same year, with one polygon or bar per subreddit.
+
+    $ python compare.py Python learnpython django flask -yr 2021 -d data -o reports
+
+The counts are shown as the share of the posts of each subreddit, this way
+small and large communities can be compared. All the data files are counted
+together in a single pass, see dataset.load_group_totals().
+"""
+
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import dataset
+import instrument
+import plotter
+from dataset import load_group_totals
+
+
+x = datetime.now()
+
+# argparse object creation
+arg = argparse.ArgumentParser(description="compares subreddits data")
+arg.add_argument("subreddits",
+                 nargs="+",
+                 help=" names of the subreddits to compare")
+arg.add_argument("-yr", "--yr",
+                 type=int,
+                 default=x.year,
+                 help=" takes in required Year")
+arg.add_argument("-j", "--jobs",
+                 type=int,
+                 default=3,
+                 help=" number of worker processes used to export the images")
+arg.add_argument("-d", "--data",
+                 type=str,
+                 default=".",
+                 help=" folder with the data files created by scraper.py")
+arg.add_argument("-o", "--output",
+                 type=str,
+                 default=".",
+                 help=" folder where the images are saved")
+arg.add_argument("-p", "--plots",
+                 nargs="+",
+                 choices=["hour", "month", "weekday"],
+                 default=["hour", "month", "weekday"],
+                 help=" plots to create, all of them by default")
+arg.add_argument("--out-of-core",
+                 type=int,
+                 default=256,
+                 help=" data files larger than this many megabytes are read in chunks")
+arg.add_argument("--tz",
+                 type=str,
+                 default="UTC",
+                 help=" timezone of the plots, e.g. America/Mexico_City (only for files with UTC epochs, "
+                      "the ISO dates are in the local time of the scraper)")
+arg.add_argument("--cache",
+                 type=str,
+                 default=".render-cache",
+                 help=" folder where the exported images are cached")
+arg.add_argument("--cache-size",
+                 type=int,
+                 default=256,
+                 help=" maximum size of the image cache in megabytes")
+arg.add_argument("--no-cache",
+                 action="store_true",
+                 help=" always exports the images, without using the cache")
+arg.add_argument("--timings",
+                 type=str,
+                 default=None,
+                 help=" saves the time, rows and peak memory of each stage to this JSON file")
+arg.add_argument("--profile",
+                 type=str,
+                 default=None,
+                 help=" saves a cProfile file for each stage to this folder")
+
+
+def to_share(totals):
+    """
+    This function converts the counts of each subreddit (rows) to percentages of its total.
+    """
+
+    # A subreddit without posts would be divided by 0, its shares are left at 0.
+    return totals.div(totals.sum(axis=1).replace(0, 1), axis=0) * 100
+
+
+def time_zone(args):
+    """
+    This function returns the timezone shown in the titles of the plots, see dataset.time_zone().
+    It raises a ValueError if --tz can't be used with the data files.
+    """
+
+    return dataset.time_zone([dataset.find_data(name, args.yr, args.data) for name in args.subreddits], args.tz)
+
+
+def legend_name(totals, name):
+    """
+    This function returns the legend label of a subreddit, with its number of posts.
+    """
+
+    return f"r/{name} ({totals.loc[name].sum():,.0f})"
+
+
+def plot_compare_radar(totals, args):
+    """
+    This function creates a radar chart with one polygon per subreddit
+    that shows their distributions by hour of the day.
+
+    It takes the totals by hour from dataset.load_group_totals() and returns the figure.
+    """
+
+    import plotly.graph_objects as go
+    from plotly.colors import qualitative
+
+    final = to_share(totals)
+
+    # Like in plotter.plot_radar() the first hour is repeated at the end to close the polygons.
+    labels = [f"{hour} hrs." for hour in final.columns] + [f"{final.columns[0]} hrs."]
+
+    fig = go.Figure()
+
+    for name, row in final.iterrows():
+        fig.add_trace(
+            go.Scatterpolar(
+                r=[*row, row.iloc[0]],
+                theta=labels,
+                name=legend_name(totals, name),
+                line_width=3,
+                hovertemplate="%{theta}: %{r:.2f}%"
+            )
+        )
+
+    fig.update_polars(
+        angularaxis_direction="clockwise",
+        angularaxis_nticks=24,
+        angularaxis_ticks="outside",
+        angularaxis_ticklen=12,
+        angularaxis_tickcolor="#FFFFFF",
+        angularaxis_tickwidth=0.75,
+        angularaxis_gridwidth=0.75,
+        angularaxis_linewidth=2,
+        radialaxis_gridwidth=0.75,
+        radialaxis_ticksuffix="%",
+        bgcolor="#041C32",
+    )
+
+    fig.update_layout(
+        showlegend=True,
+        legend_x=1.02,
+        legend_y=0.5,
+        legend_xanchor="left",
+        legend_yanchor="middle",
+        legend_borderwidth=1.5,
+        width=1280,
+        height=1000,
+        font_family="Jura",
+        font_color="#FFFFFF",
+        font_size=16,
+        title_text=f"Share of submissions by hour in {len(totals):,} subreddits during {args.yr} ({time_zone(args)})",
+        title_x=0.5,
+        title_y=0.96,
+        margin_t=120,
+        margin_l=40,
+        margin_r=40,
+        margin_b=120,
+        title_font_size=22,
+        paper_bgcolor="#04293A",
+        colorway=qualitative.Light24,
+        annotations=[
+            dict(
+                x=0.01,
+                y=-0.12,
+                xref="paper",
+                yref="paper",
+                xanchor="left",
+                yanchor="top",
+                text="Source: Pushshift API",
+            ),
+            dict(
+                x=1.01,
+                y=-0.12,
+                xref="paper",
+                yref="paper",
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita",
+            ),
+        ])
+
+    return fig
+
+
+def plot_compare_bars(totals, args, ticks, title):
+    """
+    This function creates a bar chart with a group of bars for each column
+    of the totals (e.g. each month) and one bar per subreddit in each group.
+    """
+
+    import plotly.graph_objects as go
+    from plotly.colors import qualitative
+
+    final = to_share(totals)
+
+    fig = go.Figure()
+
+    for name, row in final.iterrows():
+        fig.add_trace(
+            go.Bar(
+                x=final.columns,
+                y=row,
+                name=legend_name(totals, name),
+                marker_line_width=0,
+                hovertemplate="%{y:.2f}%"
+            )
+        )
+
+    fig.update_xaxes(
+        title=title,
+        ticktext=list(ticks.values()),
+        tickvals=list(ticks.keys()),
+        ticks="outside",
+        ticklen=10,
+        zeroline=False,
+        title_standoff=20,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        showline=True,
+        showgrid=False,
+        mirror=True
+    )
+
+    fig.update_yaxes(
+        title="Share of submissions",
+        range=[0, final.to_numpy().max() * 1.1 if final.size else 1],
+        ticks="outside",
+        ticksuffix="%",
+        tickfont_size=14,
+        ticklen=10,
+        title_standoff=6,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        gridwidth=0.5,
+        showline=True,
+        nticks=20,
+        mirror=True
+    )
+
+    fig.update_layout(
+        showlegend=True,
+        legend_x=1.02,
+        legend_y=0.5,
+        legend_xanchor="left",
+        legend_yanchor="middle",
+        legend_borderwidth=1.5,
+        barmode="group",
+        bargap=0.15,
+        width=1600,
+        height=720,
+        font_family="Jura",
+        font_color="#FFFFFF",
+        font_size=18,
+        title_text=f"Share of submissions by {title.lower()} in {len(totals):,} subreddits during {args.yr} ({time_zone(args)})",
+        title_x=0.5,
+        title_y=0.965,
+        margin_t=60,
+        margin_l=100,
+        margin_r=40,
+        margin_b=90,
+        title_font_size=24,
+        plot_bgcolor="#041C32",
+        paper_bgcolor="#04293A",
+        colorway=qualitative.Light24,
+        annotations=[
+            dict(
+                x=0.01,
+                y=-0.14,
+                xref="paper",
+                yref="paper",
+                xanchor="left",
+                yanchor="top",
+                text="Source: Pushshift API"
+            ),
+            dict(
+                x=1.01,
+                y=-0.14,
+                xref="paper",
+                yref="paper",
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita"
+            )
+        ])
+
+    return fig
+
+
+def plot_compare_months(totals, args):
+    """
+    This function creates the bar chart of the distributions by month.
+    """
+
+    # Hard-coded abbreviations of the months.
+    months_ticks = {1: "Jan", 2: "Feb", 3: "Mar", 4: "Apr",
+                    5: "May", 6: "Jun", 7: "Jul", 8: "Aug",
+                    9: "Sep", 10: "Oct", 11: "Nov", 12: "Dec"}
+
+    return plot_compare_bars(totals, args, months_ticks, "Month")
+
+
+def plot_compare_weekdays(totals, args):
+    """
+    This function creates the bar chart of the distributions by day of the week.
+    """
+
+    # Hard-coded names of the days of the week.
+    days = {0: "Monday", 1: "Tuesday", 2: "Wednesday",
+            3: "Thursday", 4: "Friday", 5: "Saturday", 6: "Sunday"}
+
+    return plot_compare_bars(totals, args, days, "Day of the week")
+
+
+# Each plot function with the key of the totals it needs and its file name.
+PLOTS = {
+    "hour": (plot_compare_radar, "hour", "compare-hour.png"),
+    "month": (plot_compare_months, "month", "compare-month.png"),
+    "weekday": (plot_compare_weekdays, "weekday", "compare-weekday.png")
+}
+
+
+if __name__ == "__main__":
+
+    args = arg.parse_args()
+
+    # The timezone is checked before any worker process is started.
+    try:
+        time_zone(args)
+    except ValueError as exc:
+        arg.error(str(exc))
+
+    if args.timings or args.profile:
+        instrument.enable(args.profile)
+
+    totals = load_group_totals(args.subreddits, args.yr, args.data, args.tz, args.out_of_core * 1024 * 1024)
+
+    workers = min(args.jobs, len(args.plots))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=plotter.start_worker) as executor:
+            plotter.render(totals, args, executor, PLOTS)
+    else:
+        plotter.start_worker()
+        plotter.render(totals, args, plots=PLOTS)
+
+    if args.timings:
+        instrument.save(args.timings, script="compare", args=vars(args))
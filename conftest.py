@@ -0,0 +1,48 @@
+"""
+This file has the pytest fixtures shared by the tests, they start the
+mock Pushshift server of mock_pushshift.py on a free port.
+"""
+
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import mock_pushshift
+
+
+@pytest.fixture
+def pushshift():
+    """
+    This fixture returns a function that starts a mock server with the posts
+    (e.g. from mock_pushshift.generate_posts()) and returns its URL and its handler,
+    the posts of the handler can be changed between requests. The servers are
+    stopped after the test.
+    """
+
+    servers = list()
+
+    def start(posts, fail_rate=0.0):
+
+        # Each server has its own posts, so the handler attributes are set in a subclass.
+        posts = sorted(posts, key=lambda post: post["created_utc"])
+
+        handler = type("Handler", (mock_pushshift.Handler,), {
+            "posts": posts,
+            "timestamps": [post["created_utc"] for post in posts],
+            "fail_rate": fail_rate
+        })
+
+        server = ThreadingHTTPServer(("localhost", 0), handler)
+        server.daemon_threads = True
+        servers.append(server)
+
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        return f"http://localhost:{server.server_address[1]}", handler
+
+    yield start
+
+    for server in servers:
+        server.shutdown()
+        server.server_close()
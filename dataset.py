@@ -0,0 +1,726 @@
+"""
+This module loads the data collected by scraper.py and computes the counts
+needed by the plots in plotter.py.
+
+The CSV file is read only once and all the counts are computed in a single pass.
+"""
+
+import os
+import re
+from collections import Counter, deque
+
+import numpy as np
+import pandas as pd
+
+from instrument import stage
+
+
+# Number of seconds in a minute, an hour and a day, used for the integer calendar math.
+MINUTE = 60
+HOUR = 3600
+DAY = 86400
+
+# Number of rows read at a time when a column is streamed from a CSV file.
+CHUNK_SIZE = 100_000
+
+# Data files larger than this (in bytes) are counted in chunks, see load_hourly().
+OUT_OF_CORE_SIZE = 256 * 1024 * 1024
+
+# scraper.py adds this prefix to the permalinks, load_posts() can drop it to save memory.
+REDDIT_URL = "https://www.reddit.com"
+
+# Columns of the data files besides the date, the .npy files keep them in a separate CSV file.
+POST_COLUMNS = ["author", "title", "permalink"]
+
+# Words of a title: letters and numbers, with apostrophes inside them (e.g. don't).
+WORD = re.compile(r"[^\W_]+(?:['’][^\W_]+)*")
+
+# Common English words that say nothing about the topic of a post.
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been before being
+between both but by can could did do does doing don't for from get got had has
+have having he her here him his how i i'm if in into is it it's its just me more
+most my no not now of off on once only or other our out over own same she should
+so some such than that that's the their them then there these they this those
+through to too under until up very was we were what when where which while who
+whom why will with would you your
+""".split())
+
+
+def year_bounds(year):
+    """
+    This function returns the epochs of the first second of the
+    specified year and of the following one.
+    """
+
+    start = np.datetime64(f"{year}-01-01", "s").astype(np.int64)
+    end = np.datetime64(f"{year + 1}-01-01", "s").astype(np.int64)
+
+    return int(start), int(end)
+
+
+def find_data(subreddit, year, folder="."):
+    """
+    This function returns the path of the data file for the specified
+    subreddit and year, the .npy file is preferred over the CSV file.
+    """
+
+    path = os.path.join(folder, f"{subreddit}-{year}.npy")
+
+    if os.path.exists(path):
+        return path
+
+    return os.path.join(folder, f"{subreddit}-{year}.csv")
+
+
+def posts_path(path):
+    """
+    This function returns the path of the file with the author, title and
+    permalink of the posts. The .npy files keep them in a separate CSV file.
+    """
+
+    if path.endswith(".npy"):
+        return os.path.splitext(path)[0] + "-posts.csv"
+
+    return path
+
+
+def read_column(path, column, chunk_size=CHUNK_SIZE, dtype=str):
+    """
+    This function reads a single column of a CSV file in chunks,
+    so we never have the whole column in memory.
+    """
+
+    # Some usernames like 'NA' or 'null' would be read as missing values otherwise.
+    chunks = pd.read_csv(path, usecols=[column], dtype=dtype,
+                         keep_default_na=False, chunksize=chunk_size)
+
+    for chunk in chunks:
+        yield chunk[column]
+
+
+def to_local(timestamps, tz):
+    """
+    This function converts UTC epochs to the wall clock of the specified
+    timezone (e.g. America/Mexico_City), all at once.
+
+    The result is still an array of epoch seconds, so the calendar math
+    works the same for any timezone.
+    """
+
+    if tz in (None, "UTC"):
+        return timestamps
+
+    dates = pd.to_datetime(np.asarray(timestamps, dtype=np.int64), unit="s", utc=True)
+    dates = dates.tz_convert(tz).tz_localize(None)
+
+    return dates.to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+
+def date_column(path):
+    """
+    This function returns the name of the date column of a CSV file.
+    """
+
+    columns = pd.read_csv(path, nrows=0).columns
+
+    return "created_utc" if "created_utc" in columns else "isodate"
+
+
+def time_zone(paths, tz=None):
+    """
+    This function returns the timezone of the counts of the data files, for the titles of the plots.
+
+    The .npy files and the created_utc column have UTC epochs, they are converted to tz.
+    The isodate column has the local time of the machine that ran the scraper, its
+    files are shown in "local time" and tz can't be used with them (a ValueError is raised).
+    """
+
+    paths = [path for path in paths if os.path.exists(path)]
+    local = [path for path in paths if not path.endswith(".npy") and date_column(path) == "isodate"]
+
+    if not local:
+        return tz or "UTC"
+
+    if len(local) < len(paths):
+        raise ValueError("the data files mix ISO dates and UTC epochs, they can't be plotted together")
+
+    if tz not in (None, "UTC"):
+        raise ValueError(f"{local[0]} has ISO dates in the local time of the scraper, --tz can only "
+                         f"be used with UTC epochs (scraper.py --epoch or -f npy)")
+
+    return "local time"
+
+
+def to_epochs(dates, column, tz=None):
+    """
+    This function converts the values of the date column of a CSV file to epoch seconds.
+
+    The created_utc column has UTC epochs, these are converted to the specified
+    timezone. The isodate column already has the local time of the scraper,
+    so it is not converted.
+    """
+
+    if column == "created_utc":
+        return to_local(dates.to_numpy(dtype=np.int64), tz)
+
+    # Using an explicit format is much faster than letting pandas guess it.
+    dates = pd.to_datetime(dates, format="%Y-%m-%d %H:%M:%S")
+
+    return dates.to_numpy(dtype="datetime64[s]").astype(np.int64)
+
+
+def load_timestamps(path, tz=None):
+    """
+    This function reads the timestamps from the data file
+    and returns them as an array of epoch seconds.
+
+    If the path is a .npy file created by scraper.py it is memory-mapped instead,
+    this way only the pages we actually read are loaded from disk.
+
+    The .npy files have UTC epochs, these are converted to the specified timezone.
+    """
+
+    if path.endswith(".npy"):
+        return to_local(np.load(path, mmap_mode="r"), tz)
+
+    # We only need the date column, the other ones are skipped.
+    column = date_column(path)
+    df = pd.read_csv(path, usecols=[column], dtype={"created_utc": np.int64})
+
+    return to_epochs(df[column], column, tz)
+
+
+def iter_timestamps(path, tz=None, chunk_size=CHUNK_SIZE):
+    """
+    This function works like load_timestamps() but yields the timestamps
+    in chunks, so only one chunk is in memory at a time.
+    """
+
+    if path.endswith(".npy"):
+        timestamps = np.load(path, mmap_mode="r")
+
+        for start in range(0, len(timestamps), chunk_size):
+            yield to_local(np.array(timestamps[start:start + chunk_size]), tz)
+
+        return
+
+    column = date_column(path)
+    chunks = pd.read_csv(path, usecols=[column], dtype={"created_utc": np.int64}, chunksize=chunk_size)
+
+    for chunk in chunks:
+        yield to_epochs(chunk[column], column, tz)
+
+
+def load_posts(path, columns=("date", "author", "title", "permalink"), tz=None, compact=True):
+    """
+    This function reads only the specified columns of the data file and returns them
+    as a DataFrame. The 'date' column has epoch seconds, like load_timestamps().
+
+    With compact=True the authors, which repeat a lot, are read as a categorical column
+    (each name is kept once and the rows only have a small integer code) and the
+    permalinks are kept without the REDDIT_URL prefix.
+    """
+
+    others = [column for column in columns if column != "date"]
+    unknown = set(others) - set(POST_COLUMNS)
+
+    if unknown:
+        raise ValueError(f"unknown columns: {', '.join(sorted(unknown))}")
+
+    dtypes = {column: str for column in others}
+
+    if compact and "author" in dtypes:
+        dtypes["author"] = "category"
+
+    # The date of the CSV files is read in the same pass as the other columns.
+    date = date_column(path) if "date" in columns and not path.endswith(".npy") else None
+
+    if date is not None:
+        dtypes[date] = np.int64 if date == "created_utc" else str
+
+    if dtypes:
+        df = pd.read_csv(posts_path(path), usecols=list(dtypes), dtype=dtypes, keep_default_na=False)
+    else:
+        df = pd.DataFrame()
+
+    if date is not None:
+        df["date"] = to_epochs(df.pop(date), date, tz)
+    elif "date" in columns:
+        df["date"] = np.asarray(load_timestamps(path, tz))
+
+    if compact and "permalink" in df:
+        df["permalink"] = df["permalink"].str.removeprefix(REDDIT_URL)
+
+    return df[list(columns)]
+
+
+def memory_footprint(df):
+    """
+    This function returns the bytes used by each column of a DataFrame
+    (including the strings they point to) and their total.
+    """
+
+    usage = df.memory_usage(index=False, deep=True)
+    usage["total"] = usage.sum()
+
+    return usage
+
+
+def count_hours(timestamps, year, step=HOUR):
+    """
+    This function counts the timestamps by hour of the year.
+
+    The result is an array with one item per hour (8,760 or 8,784 for leap years).
+    Timestamps outside the specified year are ignored. With step=MINUTE the
+    timestamps are counted by minute instead.
+    """
+
+    start, end = year_bounds(year)
+
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    timestamps = timestamps[(timestamps >= start) & (timestamps < end)]
+
+    return np.bincount((timestamps - start) // step, minlength=(end - start) // step)
+
+
+def aggregate(hourly, year):
+    """
+    This function takes the hourly counts of a year and returns a dictionary
+    with the totals by date, hour, month and day of the week.
+
+    Each value is a Series that already contains all the possible
+    keys (all the days in the year, 0-23 hours, etc.), missing ones are 0.
+    It also has the totals by day of the week and hour (a 7x24 DataFrame)
+    and the hourly counts themselves, with their dates as the index.
+    """
+
+    return aggregate_range(hourly, f"{year}-01-01")
+
+
+def aggregate_range(hourly, since):
+    """
+    This function works like aggregate() but the hourly counts can
+    start on any day (since) and span any number of days.
+    """
+
+    # We arrange the hourly counts in a grid of days (rows) and hours (columns).
+    grid = np.asarray(hourly, dtype=np.int64).reshape(-1, 24)
+
+    by_date = grid.sum(axis=1)
+    by_hour = grid.sum(axis=0)
+
+    # We need the month and day of the week of each day.
+    # numpy datetimes make this possible without any Python loops.
+    dates = np.datetime64(since, "D") + np.arange(len(grid))
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12
+
+    # January 1st, 1970 was a Thursday (3), we use that as our reference.
+    weekdays = (dates.astype(np.int64) + 3) % 7
+
+    by_month = np.bincount(months, weights=by_date, minlength=12).astype(np.int64)
+    by_weekday = np.bincount(weekdays, weights=by_date, minlength=7).astype(np.int64)
+
+    # Each cell of the grid goes to the bin of its day of the week and hour (weekday * 24 + hour).
+    cells = weekdays[:, np.newaxis] * 24 + np.arange(24)
+    by_weekday_hour = np.bincount(cells.ravel(), weights=grid.ravel(), minlength=7 * 24).astype(np.int64)
+
+    return {
+        "date": pd.Series(by_date, index=pd.DatetimeIndex(dates)),
+        "hour": pd.Series(by_hour, index=np.arange(24)),
+        "month": pd.Series(by_month, index=np.arange(1, 13)),
+        "weekday": pd.Series(by_weekday, index=np.arange(7)),
+        "weekday_hour": pd.DataFrame(by_weekday_hour.reshape(7, 24), index=np.arange(7), columns=np.arange(24)),
+        "hourly": pd.Series(grid.ravel(), index=pd.date_range(dates[0], periods=grid.size, freq="h"))
+    }
+
+
+def rollup_path(path, tz=None):
+    """
+    This function returns the path of the rollup of a data file.
+
+    The rollup is a .npy file with the counts by hour of the year, it is
+    much smaller than the data file and has everything the plots need.
+    Each timezone has its own rollup, the default one has no suffix.
+    """
+
+    if tz in (None, "UTC"):
+        return os.path.splitext(path)[0] + "-hourly.npy"
+
+    return os.path.splitext(path)[0] + f"-hourly-{tz.replace('/', '_')}.npy"
+
+
+def save_rollup(path, hourly):
+    """
+    This function saves the hourly counts to the rollup file.
+    """
+
+    # We write to a temporary file and then replace the old one.
+    with open(path + ".tmp", "wb") as npy_file:
+        np.save(npy_file, np.asarray(hourly, dtype=np.int64))
+
+    os.replace(path + ".tmp", path)
+
+
+def load_hourly(path, year, tz=None, out_of_core=OUT_OF_CORE_SIZE):
+    """
+    This function returns the counts by hour of the year of the data file.
+
+    If the data file has an up to date rollup we read it instead, otherwise
+    we count the timestamps and save the result as the new rollup.
+
+    Data files larger than out_of_core bytes are read in chunks and the counts
+    of each chunk are added up, this way we never need all the timestamps in memory.
+    """
+
+    rollup = rollup_path(path, tz)
+
+    if os.path.exists(rollup) and os.path.getmtime(rollup) >= os.path.getmtime(path):
+        with stage("load_rollup"):
+            return np.load(rollup)
+
+    if os.path.getsize(path) > out_of_core:
+        start, end = year_bounds(year)
+
+        with stage("count_hours_chunked") as record:
+            hourly = np.zeros((end - start) // HOUR, dtype=np.int64)
+            record["rows"] = 0
+
+            for timestamps in iter_timestamps(path, tz):
+                hourly += count_hours(timestamps, year)
+                record["rows"] += len(timestamps)
+
+        save_rollup(rollup, hourly)
+
+        return hourly
+
+    with stage("load_timestamps") as record:
+        timestamps = load_timestamps(path, tz)
+        record["rows"] = len(timestamps)
+
+    with stage("count_hours", len(timestamps)):
+        hourly = count_hours(timestamps, year)
+
+    save_rollup(rollup, hourly)
+
+    return hourly
+
+
+def load_totals(path, year, tz=None, out_of_core=OUT_OF_CORE_SIZE):
+    """
+    This function reads the data file once and returns the totals used by all the plots.
+    """
+
+    hourly = load_hourly(path, year, tz, out_of_core)
+
+    with stage("aggregate", int(hourly.sum())):
+        return aggregate(hourly, year)
+
+
+def load_range_totals(subreddit, since, until, folder=".", tz=None, out_of_core=OUT_OF_CORE_SIZE):
+    """
+    This function returns the totals of all the days between since and until
+    (both included), these can span several years.
+
+    The hourly counts of each year are read from its own data file (or its rollup),
+    joined together and then cut to the requested days.
+    """
+
+    since = np.datetime64(since, "D")
+    until = np.datetime64(until, "D")
+
+    # numpy years are counted from 1970.
+    first = int(since.astype("datetime64[Y]").astype(np.int64)) + 1970
+    last = int(until.astype("datetime64[Y]").astype(np.int64)) + 1970
+
+    hourly = np.concatenate([load_hourly(find_data(subreddit, year, folder), year, tz, out_of_core)
+                             for year in range(first, last + 1)])
+
+    start = int((since - np.datetime64(f"{first}-01-01", "D")).astype(np.int64)) * 24
+    end = start + (int((until - since).astype(np.int64)) + 1) * 24
+
+    hourly = hourly[start:end]
+
+    with stage("aggregate", int(hourly.sum())):
+        return aggregate_range(hourly, since)
+
+
+def load_group_hourly(paths, year, tz=None, out_of_core=OUT_OF_CORE_SIZE):
+    """
+    This function returns the counts by hour of the year of several data files,
+    as a 2D array with one row per file.
+
+    The files with an up to date rollup (or too large to be read at once) are loaded
+    with load_hourly(). The timestamps of the rest are joined in a single array,
+    together with the row of the file each one came from, and counted all at once.
+    """
+
+    start, end = year_bounds(year)
+    hours = (end - start) // HOUR
+
+    hourly = np.zeros((len(paths), hours), dtype=np.int64)
+    pending = list()
+
+    for row, path in enumerate(paths):
+        rollup = rollup_path(path, tz)
+
+        if (os.path.exists(rollup) and os.path.getmtime(rollup) >= os.path.getmtime(path)) \
+                or os.path.getsize(path) > out_of_core:
+            hourly[row] = load_hourly(path, year, tz, out_of_core)
+        else:
+            pending.append(row)
+
+    if not pending:
+        return hourly
+
+    with stage("load_timestamps") as record:
+        parts = [load_timestamps(paths[row], tz) for row in pending]
+        record["rows"] = sum(len(part) for part in parts)
+
+    with stage("count_group_hours", record["rows"]):
+        timestamps = np.concatenate(parts).astype(np.int64, copy=False)
+        rows = np.repeat(pending, [len(part) for part in parts])
+
+        inside = (timestamps >= start) & (timestamps < end)
+
+        # Each file gets its own range of bins, so a single bincount counts all of them.
+        codes = rows[inside] * hours + (timestamps[inside] - start) // HOUR
+        hourly += np.bincount(codes, minlength=len(paths) * hours).reshape(len(paths), hours)
+
+    for row in pending:
+        save_rollup(rollup_path(paths[row], tz), hourly[row])
+
+    return hourly
+
+
+def aggregate_groups(hourly, names, year):
+    """
+    This function works like aggregate() for the 2D array of load_group_hourly(),
+    it returns DataFrames with one row per name and one column per hour, month
+    and day of the week.
+    """
+
+    # We arrange the hourly counts in a grid of groups, days and hours.
+    grid = np.asarray(hourly, dtype=np.int64).reshape(len(names), -1, 24)
+
+    by_date = grid.sum(axis=2)
+    by_hour = grid.sum(axis=1)
+
+    dates = np.datetime64(f"{year}-01-01", "D") + np.arange(grid.shape[1])
+    months = dates.astype("datetime64[M]").astype(np.int64) % 12
+    weekdays = (dates.astype(np.int64) + 3) % 7
+
+    # Like in load_group_hourly(), each group gets its own range of bins.
+    groups = np.arange(len(names))[:, np.newaxis]
+
+    by_month = np.bincount((groups * 12 + months).ravel(), weights=by_date.ravel(),
+                           minlength=len(names) * 12).astype(np.int64).reshape(-1, 12)
+    by_weekday = np.bincount((groups * 7 + weekdays).ravel(), weights=by_date.ravel(),
+                             minlength=len(names) * 7).astype(np.int64).reshape(-1, 7)
+
+    return {
+        "hour": pd.DataFrame(by_hour, index=names, columns=np.arange(24)),
+        "month": pd.DataFrame(by_month, index=names, columns=np.arange(1, 13)),
+        "weekday": pd.DataFrame(by_weekday, index=names, columns=np.arange(7))
+    }
+
+
+def load_group_totals(subreddits, year, folder=".", tz=None, out_of_core=OUT_OF_CORE_SIZE):
+    """
+    This function returns the totals by hour, month and day of the week
+    of several subreddits, with one row per subreddit.
+    """
+
+    hourly = load_group_hourly([find_data(subreddit, year, folder) for subreddit in subreddits],
+                               year, tz, out_of_core)
+
+    with stage("aggregate_groups", int(hourly.sum())):
+        return aggregate_groups(hourly, list(subreddits), year)
+
+
+def load_minutes(path, year, tz=None, out_of_core=OUT_OF_CORE_SIZE):
+    """
+    This function returns the counts by minute of the year of the data file
+    (525,600 or 527,040 of them) as a Series with their dates as the index.
+
+    Like in load_hourly() the data files larger than out_of_core bytes are read in chunks.
+    """
+
+    start, end = year_bounds(year)
+
+    with stage("count_minutes") as record:
+        if os.path.getsize(path) > out_of_core:
+            minutes = np.zeros((end - start) // MINUTE, dtype=np.int64)
+            record["rows"] = 0
+
+            for timestamps in iter_timestamps(path, tz):
+                minutes += count_hours(timestamps, year, MINUTE)
+                record["rows"] += len(timestamps)
+        else:
+            timestamps = load_timestamps(path, tz)
+            record["rows"] = len(timestamps)
+
+            minutes = count_hours(timestamps, year, MINUTE)
+
+    return pd.Series(minutes, index=pd.date_range(f"{year}-01-01", periods=len(minutes), freq="min"))
+
+
+def activity(counts, window="7D", max_points=2_000):
+    """
+    This function returns the counts of each hour (or minute) with their rolling
+    average over the window (e.g. 7D for 7 days), ready to be plotted.
+
+    A year has 8,760 hours and more than half a million minutes, sending all of them
+    to plotly makes the figures huge and slow to export. When there are more than
+    max_points values we join consecutive ones in buckets: each row has the average
+    and the maximum counts of its bucket and the rolling average at its start.
+    """
+
+    final = pd.DataFrame(data={"total": counts.astype(np.float64)})
+
+    # The rolling average is computed with all the values, before we join them.
+    final["rolling"] = final["total"].rolling(window, min_periods=1).mean()
+    final["peak"] = final["total"]
+
+    size = -(-len(final) // max_points)
+
+    if size > 1:
+        starts = np.arange(0, len(final), size)
+        lengths = np.diff(np.append(starts, len(final)))
+
+        # reduceat adds up (or takes the maximum of) each bucket without any Python loops.
+        final = pd.DataFrame(data={
+            "total": np.add.reduceat(final["total"].to_numpy(), starts) / lengths,
+            "rolling": final["rolling"].to_numpy()[starts],
+            "peak": np.maximum.reduceat(final["peak"].to_numpy(), starts)
+        }, index=final.index[starts])
+
+    # The plot says how many hours (or minutes) each point covers.
+    final.attrs["bucket"] = size
+
+    return final
+
+
+def top_authors(path, top=20, capacity=10_000, exact=False, compact=False, out_of_core=OUT_OF_CORE_SIZE):
+    """
+    This function returns the authors with the most posts in a single pass over
+    the data file, without keeping a counter for every author.
+
+    It uses the Misra-Gries summary: we keep at most 'capacity' counters and when
+    there are more we subtract the count of the (capacity + 1)-th author from all
+    of them and drop the ones that reach 0. Any author with more than
+    rows / (capacity + 1) posts is guaranteed to be kept.
+
+    The result is a Series with the counts of the top authors, its attrs have the
+    number of rows and the error: the counts are never higher than the real ones
+    and at most 'error' lower. When there are fewer authors than counters (or with
+    exact=True) nothing is ever subtracted and the counts are exact.
+
+    Files larger than out_of_core bytes are read in chunks, the smaller ones are
+    read at once with load_posts(). With compact=True the authors are read as a
+    categorical column.
+    """
+
+    counts = pd.Series(dtype=np.int64)
+    error = 0
+    rows = 0
+
+    if os.path.getsize(posts_path(path)) > out_of_core:
+        chunks = read_column(posts_path(path), "author", dtype="category" if compact else str)
+    else:
+        chunks = [load_posts(path, ("author",), compact=compact)["author"]]
+
+    for chunk in chunks:
+        # Deleted accounts are not real authors.
+        chunk = chunk[chunk != "[deleted]"]
+        rows += len(chunk)
+
+        chunk_counts = chunk.value_counts()
+
+        # The categorical counts have every category of the chunk, even the ones we just removed.
+        if compact:
+            chunk_counts = chunk_counts[chunk_counts > 0]
+            chunk_counts.index = chunk_counts.index.astype(str)
+
+        counts = counts.add(chunk_counts, fill_value=0)
+
+        if not exact and len(counts) > capacity:
+            threshold = counts.nlargest(capacity + 1).iloc[-1]
+            counts = counts[counts > threshold] - threshold
+            error += int(threshold)
+
+    result = counts.nlargest(top).astype(np.int64)
+    result.index.name = "author"
+    result.attrs = {"rows": rows, "error": error}
+
+    return result
+
+
+def count_terms(titles):
+    """
+    This function counts the words and bigrams (pairs of consecutive words) of
+    the titles, leaving out the stopwords. It returns two Counters.
+
+    It runs in the worker processes, each call gets a chunk of the titles.
+    """
+
+    words = list()
+    bigrams = list()
+
+    for title in titles:
+        # Stopwords and numbers are replaced with None, so they also break the bigrams.
+        tokens = [None if token in STOPWORDS or token.isdigit() else token
+                  for token in WORD.findall(title.lower())]
+
+        words.extend(filter(None, tokens))
+        bigrams.extend(f"{first} {second}" for first, second in zip(tokens, tokens[1:]) if first and second)
+
+    # Counting whole lists at once is much faster than updating the Counters for each title.
+    return Counter(words), Counter(bigrams)
+
+
+def top_terms(path, top=20, executor=None, jobs=1):
+    """
+    This function returns the most common words and bigrams of the titles.
+
+    The titles are read in chunks and, if an executor is given, each chunk is counted
+    in a worker process and the partial counters are merged as they finish. We never
+    have more than two chunks per job waiting, this way the memory stays bounded.
+
+    The result is a Series with a (kind, term) index, where kind is 'word' or 'bigram'.
+    """
+
+    words = Counter()
+    bigrams = Counter()
+
+    pending = deque()
+    limit = 2 * jobs
+    rows = 0
+
+    def merge(counters):
+        words.update(counters[0])
+        bigrams.update(counters[1])
+
+    for chunk in read_column(posts_path(path), "title"):
+        rows += len(chunk)
+
+        if executor is None:
+            merge(count_terms(chunk.tolist()))
+            continue
+
+        pending.append(executor.submit(count_terms, chunk.tolist()))
+
+        if len(pending) >= limit:
+            merge(pending.popleft().result())
+
+    while pending:
+        merge(pending.popleft().result())
+
+    result = pd.concat([
+        pd.Series(dict(words.most_common(top)), dtype=np.int64),
+        pd.Series(dict(bigrams.most_common(top)), dtype=np.int64)
+    ], keys=["word", "bigram"])
+
+    result.attrs = {"rows": rows}
+
+    return result
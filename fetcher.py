@@ -0,0 +1,370 @@
+"""
+This module downloads posts from the Pushshift API with asyncio, it is
+used by scraper.py when it runs with --engine async.
+
+All the requests go through a small pool of keep-alive connections and a
+token bucket that spaces them evenly. When the server answers with 429 (too
+many requests) or a 5xx error the bucket halves its rate and then recovers
+it slowly with each successful request, so we stay just under the limits of
+the server instead of alternating bursts and long pauses.
+
+Only the standard library is used, the HTTP/1.1 client is very small and
+only supports what Pushshift needs (GET requests with JSON responses).
+"""
+
+import asyncio
+import json
+import ssl
+import time
+from urllib.parse import urlencode, urlsplit
+
+
+# Default server, --endpoint replaces it.
+PUSHSHIFT_URL = "https://api.pushshift.io"
+
+# Number of posts requested per page.
+PAGE_SIZE = 100
+
+# Seconds we wait for a response before trying again.
+TIMEOUT = 60
+
+
+class RetryableError(Exception):
+    """
+    This exception is raised for the responses that can be retried (429 and 5xx).
+    """
+
+    def __init__(self, status, retry_after=None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class Metrics:
+    """
+    This class counts the requests, retries and downloaded posts.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.errors = 0
+        self.items = 0
+        self.bytes = 0
+
+    def summary(self):
+        """
+        This function returns the counters and the throughput as a dictionary.
+        """
+
+        seconds = time.perf_counter() - self.start
+
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "errors": self.errors,
+            "items": self.items,
+            "bytes": self.bytes,
+            "seconds": round(seconds, 3),
+            "requests_per_minute": round(self.requests / seconds * 60, 1) if seconds else 0,
+            "items_per_second": round(self.items / seconds, 1) if seconds else 0
+        }
+
+
+class TokenBucket:
+    """
+    This class spaces the requests so there are at most 'rate_limit' per minute.
+
+    The bucket holds a single token, this way the requests are evenly spread
+    instead of sent in bursts. The rate adapts to the server: it is halved
+    when the server complains and it grows back a bit after each success.
+    """
+
+    def __init__(self, rate_limit):
+        self.max_rate = rate_limit / 60
+        self.min_rate = self.max_rate / 32
+        self.rate = self.max_rate
+        self.tokens = 1.0
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """
+        This function waits until a request can be sent.
+        """
+
+        # The lock makes the waiting requests take their turns in order.
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self.tokens = min(1.0, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def throttle(self, retry_after=None):
+        """
+        This function halves the rate, and pauses all the requests
+        if the server told us how long to wait.
+        """
+
+        self.rate = max(self.min_rate, self.rate / 2)
+
+        if retry_after:
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+    def succeed(self):
+        """
+        This function increases the rate a little, up to the maximum rate.
+        """
+
+        self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+class ConnectionPool:
+    """
+    This class keeps a few open connections to the server and reuses them.
+    """
+
+    def __init__(self, base_url, size):
+        url = urlsplit(base_url)
+
+        self.host = url.hostname
+        self.port = url.port or (443 if url.scheme == "https" else 80)
+        self.ssl = ssl.create_default_context() if url.scheme == "https" else None
+        self.path = url.path.rstrip("/")
+
+        self.idle = list()
+        self.slots = asyncio.Semaphore(size)
+
+    async def get(self, path, params):
+        """
+        This function sends a GET request and returns the status, the headers and the body.
+        """
+
+        target = f"{self.path}{path}?{urlencode(params)}"
+
+        async with self.slots:
+            # An idle connection can be closed by the server at any moment,
+            # in that case we try again with a new one.
+            while self.idle:
+                try:
+                    return await self.send(self.idle.pop(), target)
+                except (OSError, asyncio.IncompleteReadError):
+                    pass
+
+            connection = await asyncio.open_connection(self.host, self.port, ssl=self.ssl)
+
+            try:
+                return await self.send(connection, target)
+            except asyncio.IncompleteReadError as exc:
+                raise ConnectionError("the server closed the connection") from exc
+
+    async def send(self, connection, target):
+        """
+        This function sends a request on an open connection and reads the response.
+        The connection is closed if anything goes wrong (including a timeout).
+        """
+
+        try:
+            return await self.exchange(connection, target)
+        except BaseException:
+            connection[1].close()
+            raise
+
+    async def exchange(self, connection, target):
+        """
+        This function does the actual work of send().
+        """
+
+        reader, writer = connection
+
+        writer.write((f"GET {target} HTTP/1.1\r\n"
+                      f"Host: {self.host}\r\n"
+                      "User-Agent: reddit-analyzer\r\n"
+                      "Accept: application/json\r\n"
+                      "Connection: keep-alive\r\n\r\n").encode("ascii"))
+        await writer.drain()
+
+        status_line = await reader.readuntil(b"\r\n")
+        status = int(status_line.split()[1])
+
+        headers = dict()
+
+        while True:
+            line = await reader.readuntil(b"\r\n")
+
+            if line == b"\r\n":
+                break
+
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get("transfer-encoding", "").lower() == "chunked":
+            body = b""
+
+            # Each chunk starts with its size and ends with a line break, the last one is empty.
+            while True:
+                size = int((await reader.readuntil(b"\r\n")).split(b";")[0], 16)
+                chunk = await reader.readexactly(size + 2)
+
+                if size == 0:
+                    break
+
+                body += chunk[:-2]
+        elif "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        else:
+            body = await reader.read()
+
+        # The connection goes back to the pool unless the server is closing it.
+        if headers.get("connection", "").lower() == "close" or status_line.startswith(b"HTTP/1.0"):
+            writer.close()
+        else:
+            self.idle.append(connection)
+
+        return status, headers, body
+
+    def close(self):
+        """
+        This function closes the idle connections.
+        """
+
+        for _, writer in self.idle:
+            writer.close()
+
+        self.idle.clear()
+
+
+class Client:
+    """
+    This class downloads the pages of the Pushshift searches, retrying the
+    failed requests and sharing the rate limit between all of them.
+    """
+
+    def __init__(self, base_url=None, rate_limit=60, concurrency=4, retries=5):
+        self.pool = ConnectionPool(base_url or PUSHSHIFT_URL, concurrency)
+        self.bucket = TokenBucket(rate_limit)
+        self.metrics = Metrics()
+        self.retries = retries
+
+    async def get_json(self, path, params):
+        """
+        This function returns the JSON response of a request.
+
+        429 and 5xx responses and connection errors are retried with an exponential
+        backoff, other errors (e.g. 400 for a wrong parameter) are raised at once.
+        """
+
+        for attempt in range(self.retries + 1):
+            await self.bucket.acquire()
+            self.metrics.requests += 1
+
+            try:
+                # A timeout is retried like a connection error, asyncio.TimeoutError
+                # is only an OSError since Python 3.11 so it is caught on its own.
+                status, headers, body = await asyncio.wait_for(self.pool.get(path, params), TIMEOUT)
+
+                if status == 429 or status >= 500:
+                    retry_after = headers.get("retry-after")
+                    raise RetryableError(status, float(retry_after) if retry_after else None)
+
+                if status != 200:
+                    raise RuntimeError(f"Pushshift answered HTTP {status}: {body[:200]!r}")
+
+                self.metrics.bytes += len(body)
+                self.bucket.succeed()
+
+                return json.loads(body)
+            except (RetryableError, OSError, asyncio.TimeoutError) as exc:
+                retry_after = getattr(exc, "retry_after", None)
+
+                if getattr(exc, "status", None) == 429:
+                    self.metrics.throttled += 1
+                else:
+                    self.metrics.errors += 1
+
+                self.bucket.throttle(retry_after)
+
+                if attempt == self.retries:
+                    raise
+
+                self.metrics.retries += 1
+
+                # When the server says how long to wait the bucket already pauses all the requests.
+                if not retry_after:
+                    await asyncio.sleep(min(60, 2 ** attempt))
+
+    async def search(self, subreddit, since, until, fields):
+        """
+        This function yields the pages of posts of a subreddit between
+        since and until (epochs), from newest to oldest.
+
+        Each page asks for the posts older than the oldest one of the previous page.
+        Posts of the same second can be split between two pages, so we ask again
+        for that second and drop the ones we already have.
+        """
+
+        # The posts of the oldest second of the previous page.
+        seen = set()
+
+        while since < until:
+            response = await self.get_json("/reddit/submission/search", {
+                "subreddit": subreddit,
+                "since": since,
+                "until": until,
+                "size": PAGE_SIZE,
+                "sort": "created_utc",
+                "order": "desc",
+                "filter": ",".join(["created_utc", *fields])
+            })
+
+            data = response["data"]
+
+            if not data:
+                return
+
+            page = [item for item in data if post_key(item) not in seen]
+            self.metrics.items += len(page)
+
+            if page:
+                yield page
+
+            # A page that isn't full was the last one.
+            if len(data) < PAGE_SIZE:
+                return
+
+            oldest = min(item["created_utc"] for item in data)
+            seen = {post_key(item) for item in data if item["created_utc"] == oldest}
+
+            # If the whole page was a single second it has more posts than a page,
+            # we can't get the rest of them so we continue with the previous second.
+            until = oldest + 1 if oldest + 1 < until else oldest
+
+    def close(self):
+        """
+        This function closes the connections of the client.
+        """
+
+        self.pool.close()
+
+
+def post_key(item):
+    """
+    This function returns the id of a post, or its date and permalink if it has no id.
+    """
+
+    return item.get("id") or (item["created_utc"], item.get("permalink"))
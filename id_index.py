@@ -0,0 +1,97 @@
+"""
+This module keeps the ids of the posts already saved by scraper.py, so
+the posts downloaded again by an update or by overlapping time windows
+are dropped instead of being saved twice.
+
+The reddit ids are base 36 numbers (e.g. 'qx1k2z'), we save them as a sorted
+array of 64-bit integers in a .npy file next to the data file. That is 8 bytes
+per post, so even years of history fit in memory or can be memory-mapped.
+"""
+
+import os
+import re
+
+import numpy as np
+
+from dataset import posts_path, read_column
+
+
+# The id is the part of the permalink after /comments/.
+PERMALINK_ID = re.compile(r"/comments/([0-9a-z]+)")
+
+
+def decode(post_id):
+    """
+    This function converts a base 36 id to an integer, empty ids are 0.
+    """
+
+    return int(post_id, 36) if post_id else 0
+
+
+def index_path(path):
+    """
+    This function returns the path of the id index of a data file.
+    """
+
+    return os.path.splitext(path)[0] + "-ids.npy"
+
+
+def load(path):
+    """
+    This function returns the ids saved in the index (memory-mapped),
+    or an empty array if there is no index.
+    """
+
+    if not os.path.exists(path):
+        return np.empty(0, dtype=np.int64)
+
+    return np.load(path, mmap_mode="r")
+
+
+def contains(index, ids):
+    """
+    This function returns a boolean array that tells which of the ids are in the index.
+
+    The index is sorted, so each id is found with a binary search.
+    """
+
+    ids = np.asarray(ids, dtype=np.int64)
+
+    if len(index) == 0:
+        return np.zeros(len(ids), dtype=bool)
+
+    positions = np.searchsorted(index, ids).clip(max=len(index) - 1)
+
+    return index[positions] == ids
+
+
+def save(path, ids, previous=None):
+    """
+    This function saves the ids to the index, along with the ones of a previous index.
+    """
+
+    ids = np.asarray(ids, dtype=np.int64)
+    ids = ids[ids > 0]
+
+    if previous is not None:
+        ids = np.concatenate([ids, previous])
+
+    # We write to a temporary file and then replace the old one.
+    with open(path + ".tmp", "wb") as npy_file:
+        np.save(npy_file, np.unique(ids))
+
+    os.replace(path + ".tmp", path)
+
+
+def build(path):
+    """
+    This function creates the index of a data file saved before the ids were
+    recorded, the ids are taken from the permalinks.
+    """
+
+    ids = list()
+
+    for chunk in read_column(posts_path(path), "permalink"):
+        ids.extend(decode(post_id) for post_id in chunk.str.extract(PERMALINK_ID, expand=False).fillna(""))
+
+    save(index_path(path), ids)
@@ -0,0 +1,210 @@
+"""
+This module records the wall time, number of rows and peak memory of
+each stage of scraper.py and plotter.py.
+
+It is disabled by default, the scripts enable it with --timings (a JSON
+report) and --profile (a cProfile .prof file for each stage).
+"""
+
+import cProfile
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+# The resource module is not available on Windows.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+# The finished stages of this process.
+STAGES = list()
+
+ENABLED = False
+PROFILE_DIR = None
+
+# The profiler of the open stage and the process that started it.
+PROFILER = None
+PROFILER_PID = None
+
+# The peak memory of each open stage, the innermost one last.
+PEAKS = list()
+
+# reset_hwm() also lowers the peak of the process, we keep the highest one we reset.
+# A forked worker process inherits it, so we keep the process it belongs to.
+HIGHEST = (None, 0)
+
+
+def enable(profile_dir=None):
+    """
+    This function enables the recording of the stages. If a folder is given
+    each stage is also profiled and its stats are saved there.
+    """
+
+    global ENABLED, PROFILE_DIR
+
+    ENABLED = True
+    PROFILE_DIR = profile_dir
+
+    if profile_dir:
+        os.makedirs(profile_dir, exist_ok=True)
+
+
+def peak_rss(children=False):
+    """
+    This function returns the peak memory (resident set size) of
+    this process in megabytes, or None if it is not available.
+
+    With children=True it returns the peak of the largest worker process
+    that has finished.
+    """
+
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+
+    # Linux reports kilobytes and macOS reports bytes.
+    if sys.platform == "darwin":
+        return peak / 1024 / 1024
+
+    if children:
+        return peak / 1024
+
+    pid, highest = HIGHEST
+
+    return max(peak / 1024, highest if pid == os.getpid() else 0)
+
+
+def read_hwm():
+    """
+    This function returns the peak memory of this process in megabytes since the
+    last reset_hwm(), or None if it is not available (it needs Linux).
+    """
+
+    try:
+        with open("/proc/self/status", encoding="utf-8") as status:
+            for line in status:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+
+    return None
+
+
+def reset_hwm():
+    """
+    This function resets the peak memory of this process to its current memory,
+    this way read_hwm() returns the peak of a single stage.
+    """
+
+    global HIGHEST
+
+    peak = peak_rss()
+
+    if peak is not None:
+        HIGHEST = (os.getpid(), peak)
+
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="utf-8") as clear_refs:
+            clear_refs.write("5")
+    except OSError:
+        pass
+
+
+@contextmanager
+def stage(name, rows=None):
+    """
+    This context manager records a stage. It yields a dictionary where
+    the number of rows can be set when it is not known in advance:
+
+        with stage("load") as record:
+            data = load()
+            record["rows"] = len(data)
+    """
+
+    record = {"stage": name, "rows": rows}
+
+    if not ENABLED:
+        yield record
+        return
+
+    global PROFILER, PROFILER_PID
+
+    profiler = None
+
+    if PROFILE_DIR:
+        # A worker process forked inside a profiled stage inherits its profiler, we stop it
+        # (since Python 3.12 only one can be active). A stage inside another one of the same
+        # process is already in the profile of the outer stage.
+        if PROFILER is not None and PROFILER_PID != os.getpid():
+            PROFILER.disable()
+            PROFILER = None
+
+        if PROFILER is None:
+            profiler = cProfile.Profile()
+
+    # The peak of an outer stage is kept before it is reset for this one.
+    if PEAKS:
+        PEAKS[-1] = max(PEAKS[-1], read_hwm() or 0)
+
+    reset_hwm()
+    PEAKS.append(0)
+
+    start = time.perf_counter()
+
+    try:
+        if profiler:
+            profiler.enable()
+            PROFILER, PROFILER_PID = profiler, os.getpid()
+
+        yield record
+    finally:
+        if profiler:
+            profiler.disable()
+            PROFILER = None
+            profiler.dump_stats(os.path.join(PROFILE_DIR, f"{name}-{os.getpid()}.prof"))
+
+        record["seconds"] = round(time.perf_counter() - start, 6)
+
+        # The peak of this stage includes the peaks of the stages inside it.
+        peak = read_hwm()
+        inner = PEAKS.pop()
+
+        if peak is not None:
+            peak = max(peak, inner)
+
+            if PEAKS:
+                PEAKS[-1] = max(PEAKS[-1], peak)
+
+        # Only Linux can tell the peak of a stage, the peak so far is recorded everywhere.
+        record["peak_rss_mb"] = peak
+        record["max_rss_mb"] = peak_rss() if peak is None else max(peak_rss() or 0, peak)
+        record["pid"] = os.getpid()
+
+        STAGES.append(record)
+
+
+def collect(first=0):
+    """
+    This function returns the stages recorded after the first ones and removes them,
+    it is used to send the stages of a worker process back to the main one.
+    """
+
+    stages = STAGES[first:]
+    del STAGES[first:]
+
+    return stages
+
+
+def save(path, **info):
+    """
+    This function saves the recorded stages to a JSON file, along with any extra information.
+    """
+
+    with open(path, "w", encoding="utf-8") as json_file:
+        json.dump({**info, "stages": STAGES}, json_file, indent=4)
@@ -0,0 +1,192 @@
+"""
+This script starts a local server that imitates the Pushshift API, it can be
+used to try scraper.py without an internet connection:
+
+    $ python mock_pushshift.py -r Python -yr 2021 -n 50000
+    $ python scraper.py -r Python -yr 2021 --endpoint http://localhost:8000
+
+The posts are randomly generated (always the same ones for the same arguments).
+"""
+
+import argparse
+import bisect
+import json
+import random
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+# Used it for parsing default year
+x = datetime.now()
+
+# argparse object creation
+arg = argparse.ArgumentParser(description="Local imitation of the Pushshift API")
+arg.add_argument("-r", "--r",
+                 type=str,
+                 default="Python",
+                 help=" name of the subreddit")
+arg.add_argument("-yr", "--yr",
+                 type=int,
+                 default=x.year,
+                 help=" year of the generated posts")
+arg.add_argument("-n", "--posts",
+                 type=int,
+                 default=10_000,
+                 help=" number of generated posts")
+arg.add_argument("-p", "--port",
+                 type=int,
+                 default=8000,
+                 help=" port of the server")
+arg.add_argument("--fail-rate",
+                 type=float,
+                 default=0.0,
+                 help=" fraction of the requests answered with a 429 or 503 error, e.g. 0.1")
+
+
+def base36(number):
+    """
+    This function converts a number to base 36, the format of the reddit ids.
+    """
+
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    text = ""
+
+    while True:
+        number, remainder = divmod(number, 36)
+        text = digits[remainder] + text
+
+        if number == 0:
+            return text
+
+
+def generate_posts(subreddit, year, count, seed=0):
+    """
+    This function generates random posts for the specified subreddit and year.
+    The posts are returned sorted from oldest to newest.
+    """
+
+    rnd = random.Random(f"{subreddit}-{year}-{seed}")
+
+    start = int(datetime(year, 1, 1).timestamp())
+    end = int(datetime(year + 1, 1, 1).timestamp())
+
+    timestamps = sorted(rnd.randrange(start, end) for _ in range(count))
+    posts = list()
+
+    for number, timestamp in enumerate(timestamps):
+        post_id = base36(10_000_000 + number)
+
+        posts.append({
+            "id": post_id,
+            "created_utc": timestamp,
+            "author": f"user_{rnd.randrange(count // 10 + 1)}",
+            "title": f"Post number {number}",
+            "permalink": f"/r/{subreddit}/comments/{post_id}/post_number_{number}/"
+        })
+
+    return posts
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    This class answers the /reddit/submission/search requests the same way Pushshift does:
+    newest posts first, at most 'size' of them and with the metadata pmaw needs.
+
+    Only the sort=created_utc and order=desc parameters sent by pmaw are supported,
+    the requests with any other sort or order (or the old sort_type parameter)
+    are answered with a 400 error instead of being silently ignored.
+
+    A fraction of the requests (fail_rate) fail with a 429 or 503 error, so the
+    retries of the scraper can be tried too.
+    """
+
+    # Keep-alive connections, like the real server.
+    protocol_version = "HTTP/1.1"
+
+    # These are set before the server starts.
+    posts = list()
+    timestamps = list()
+    fail_rate = 0.0
+
+    def do_GET(self):
+
+        url = urlparse(self.path)
+
+        if random.random() < self.fail_rate:
+            self.send_response(random.choice([429, 503]))
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if not url.path.rstrip("/").endswith("/submission/search"):
+            self.send_error(404)
+            return
+
+        if params.get("sort", "created_utc") != "created_utc" or params.get("order", "desc") != "desc" \
+                or "sort_type" in params:
+            self.send_error(400, "only sort=created_utc and order=desc are supported")
+            return
+
+        since = int(params.get("since", 0))
+        until = int(params.get("until", 2**40))
+        size = int(params.get("size", 100))
+
+        # We find the posts inside the time span with a binary search.
+        first = bisect.bisect_left(self.timestamps, since)
+        last = bisect.bisect_left(self.timestamps, until)
+
+        data = self.posts[max(first, last - size):last][::-1]
+
+        # We only return the requested fields, like Pushshift does.
+        if "filter" in params:
+            fields = params["filter"].split(",")
+            data = [{field: post[field] for field in fields if field in post} for post in data]
+
+        body = json.dumps({
+            "data": data,
+            "metadata": {
+                "es": {
+                    "hits": {"total": {"value": last - first}},
+                    "_shards": {"successful": 1, "total": 1}
+                },
+                "es_query": {
+                    "query": {"bool": {"must": [{"bool": {"must": [
+                        {"range": {"created_utc": {"gte": since * 1000}}},
+                        {"range": {"created_utc": {"lt": until * 1000}}}
+                    ]}}]}}
+                }
+            }
+        }).encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # We don't want a line for each request.
+        pass
+
+
+def main():
+
+    args = arg.parse_args()
+
+    Handler.posts = generate_posts(args.r, args.yr, args.posts)
+    Handler.timestamps = [post["created_utc"] for post in Handler.posts]
+    Handler.fail_rate = args.fail_rate
+
+    server = ThreadingHTTPServer(("localhost", args.port), Handler)
+
+    print(f"Serving {args.posts:,} posts of r/{args.r} on http://localhost:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+
+    main()
@@ -2,19 +2,28 @@
 This script creates several plots wtih the data from scrapper.py
 
 Make sure to change the CSV file name and the year (when applicable).
+
+The plot functions can also be imported from other scripts. numpy, pandas, plotly
+and kaleido are only imported when a plot needs them, so importing this module
+(or running it with --help) is fast.
 """
 
-import numpy as np
-import pandas as pd
-import plotly.graph_objects as go
-from plotly.colors import qualitative
-from plotly.subplots import make_subplots
 import argparse
-from datetime import datetime
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from multiprocessing.util import Finalize
+
+import instrument
+from instrument import stage
 
 
 x = datetime.now()
 
+# Seconds we wait for kaleido to export a test image when a worker starts.
+WARM_UP_TIMEOUT = 30
+
 # argparse object creation
 arg = argparse.ArgumentParser(description="plots subreddits data")
 arg.add_argument("-r", "--r",
@@ -25,65 +34,189 @@ arg.add_argument("-yr", "--yr",
                  type=int,
                  default=x.year,
                  help=" takes in required Year")
-args = arg.parse_args()
+arg.add_argument("-j", "--jobs",
+                 type=int,
+                 default=min(4, os.cpu_count() or 1),
+                 help=" number of worker processes used to export the images")
+arg.add_argument("-d", "--data",
+                 type=str,
+                 default=".",
+                 help=" folder where the data files are")
+arg.add_argument("-o", "--output",
+                 type=str,
+                 default=".",
+                 help=" folder where the images are saved")
+arg.add_argument("--db",
+                 type=str,
+                 default=None,
+                 help=" SQLite database created with scraper.py -f sqlite, used instead of the data files")
+arg.add_argument("--since",
+                 type=str,
+                 default=None,
+                 help=" first date of a range instead of a single year (YYYY-MM-DD), it can span several years")
+arg.add_argument("--until",
+                 type=str,
+                 default=None,
+                 help=" last date of the range (YYYY-MM-DD), today by default")
+arg.add_argument("--days",
+                 type=int,
+                 default=None,
+                 help=" number of days of the range, ending on --until (e.g. 365 for the last year)")
+arg.add_argument("-p", "--plots",
+                 nargs="+",
+                 choices=["calendar", "radar", "bars", "donut", "authors", "terms", "heatmap", "activity"],
+                 default=["calendar", "radar", "bars", "donut"],
+                 help=" plots to create, the first four by default")
+arg.add_argument("--top",
+                 type=int,
+                 default=20,
+                 help=" number of authors in the authors plot and of words and bigrams in the terms plot")
+arg.add_argument("--capacity",
+                 type=int,
+                 default=10_000,
+                 help=" maximum number of authors counted at the same time by the authors plot")
+arg.add_argument("--exact",
+                 action="store_true",
+                 help=" counts every author in the authors plot, this uses more memory")
+arg.add_argument("--resolution",
+                 choices=["hour", "minute"],
+                 default="hour",
+                 help=" resolution of the activity plot, minute is only available for a single year")
+arg.add_argument("--rolling",
+                 type=str,
+                 default="7D",
+                 help=" window of the rolling average of the activity plot (e.g. 1D, 7D, 30D)")
+arg.add_argument("--max-points",
+                 type=int,
+                 default=2000,
+                 help=" maximum number of points of the activity plot, longer series are downsampled")
+arg.add_argument("--out-of-core",
+                 type=int,
+                 default=256,
+                 help=" data files larger than this many megabytes are read in chunks")
+arg.add_argument("--low-memory",
+                 action="store_true",
+                 help=" reads every data file in chunks and the authors as categories, then prints the peak memory")
+arg.add_argument("--tz",
+                 type=str,
+                 default="UTC",
+                 help=" timezone of the plots, e.g. America/Mexico_City (only for files with UTC epochs, "
+                      "the ISO dates are in the local time of the scraper)")
+arg.add_argument("--cache",
+                 type=str,
+                 default=".render-cache",
+                 help=" folder where the exported images are cached")
+arg.add_argument("--cache-size",
+                 type=int,
+                 default=256,
+                 help=" maximum size of the image cache in megabytes")
+arg.add_argument("--no-cache",
+                 action="store_true",
+                 help=" always exports the images, without using the cache")
+arg.add_argument("--timings",
+                 type=str,
+                 default=None,
+                 help=" saves the time, rows and peak memory of each stage to this JSON file")
+arg.add_argument("--profile",
+                 type=str,
+                 default=None,
+                 help=" saves a cProfile file for each stage to this folder")
 
 
-def plot_calendar(args):
+def date_range(args):
     """
-    This function will create a calendar plot, very similar to
-    the one seen in GitHub profiles.
+    This function returns the first and last dates (both included) of the
+    range requested with --since, --until and --days, or None for a single year.
     """
 
-    # This plot needs to know the year so it can configure itself.
-    year = args.yr
+    if args.since is None and args.days is None:
+        return None
 
-    # We read our CSV file and make the isodate column our index.
-    df = pd.read_csv(
-        f"./{args.r}-{year}.csv",
-        parse_dates=["isodate"],
-        index_col="isodate"
-    )
+    until = args.until or f"{datetime.now():%Y-%m-%d}"
+
+    if args.since:
+        return args.since, until
+
+    # We subtract the days from the last date with the standard library,
+    # numpy is not imported yet.
+    since = datetime.strptime(until, "%Y-%m-%d") - timedelta(days=args.days - 1)
+
+    return f"{since:%Y-%m-%d}", until
+
+
+def period(args):
+    """
+    This function returns the period of the plots for their titles.
+    """
+
+    dates = date_range(args)
 
-    # For this plot We only need the date (not time), we extract it from the datetime index.
-    df["date"] = df.index.date
+    if dates is None:
+        return f"during {args.yr}"
 
-    # We extract the value counts of each date found into a Series.
-    totals = df["date"].value_counts().sort_index()
+    return f"from {dates[0]} to {dates[1]}"
 
-    # In order for the calendar to work we need to create a 'skeleton' with all
-    # the days in the specified year.
-    # We create this skeleton using a date_range. Then we will add the previously
-    # created Series as the 'total' column.
-    # We might get NA values for missing days. We will address that in a bit.
-    final = pd.DataFrame(index=pd.date_range(
-        f"{year}-01-01", f"{year}-12-31", freq="d"), data={"total": totals})
 
-    # For this calendar to work we need a grid of 53 columns and 7 rows.
-    # We can't use the week, dayofyear or similar properties from the date index
-    # as they use the Gregorian calendar.
-    # That being said we create such grid.
-    week_numbers = list()
+def time_zone(args):
+    """
+    This function returns the timezone shown in the titles of the plots, see dataset.time_zone().
+    It raises a ValueError if --tz can't be used with the data files.
+    """
+
+    import dataset
+
+    # The database keeps the UTC epochs.
+    if args.db:
+        return args.tz
+
+    dates = date_range(args)
+    years = [args.yr] if dates is None else range(int(dates[0][:4]), int(dates[1][:4]) + 1)
+
+    return dataset.time_zone([dataset.find_data(args.r, year, args.data) for year in years], args.tz)
+
+
+def plot_calendar(totals, args):
+    """
+    This function will create a calendar plot, very similar to
+    the one seen in GitHub profiles.
+
+    It takes the totals by date from dataset.aggregate() (or any range of dates
+    from dataset.load_range_totals()) and returns the figure, each year in the
+    totals gets its own panel.
+    """
+
+    import numpy as np
+    import pandas as pd
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
 
-    for week in range(53):
-        week_numbers.extend([week for _ in range(7)])
+    # The totals already contain all the days in the requested dates,
+    # (missing days are 0) so they are the 'skeleton' of our calendar.
+    final = pd.DataFrame(data={"total": totals})
 
-    # We extract the day of the week from the first day of the year, this will be used
-    # to slice the previously created list. This is because not all years start on Mondays.
-    pad = final.index[0].dayofweek
+    # For this calendar to work we need a grid of 53 (sometimes 54) columns and 7 rows
+    # for each year. We can't use the week, dayofyear or similar properties from the
+    # date index as they use the Gregorian calendar, instead we compute the grid
+    # for all the days at once with numpy datetimes.
+    dates = final.index.to_numpy(dtype="datetime64[D]")
+    first_days = dates.astype("datetime64[Y]").astype("datetime64[D]")
 
+    # January 1st, 1970 was a Thursday (3), we use that as our reference.
     # This column will be used for our Y-axis.
-    final["dayofweek"] = final.index.dayofweek
+    final["dayofweek"] = (dates.astype(np.int64) + 3) % 7
 
-    # This column will be used for our x-axis, notice how we slice
-    # the week_numbers list. This way it will be the exact size as the DataFrame.
-    final["week"] = week_numbers[pad:len(final) + pad]
+    # This column will be used for our x-axis. Not all years start on Mondays,
+    # so we shift the days of each year by the day of the week of its January 1st.
+    pad = (first_days.astype(np.int64) + 3) % 7
+    final["week"] = ((dates - first_days).astype(np.int64) + pad) // 7
+
+    # Each year gets its own panel.
+    final["year"] = dates.astype("datetime64[Y]").astype(np.int64) + 1970
+    years = final["year"].unique()
 
     # Calendar plots have the problem that it is hard to determine where the months start
     # my attempt to fix this is to add a border to the first day of each month.
-    final["border"] = final.index.map(lambda x: 1 if x.day == 1 else 0)
-
-    # Optional: fill NA values (missing days) with 0.
-    final["total"].fillna(0, inplace=True)
+    final["border"] = (dates.astype("datetime64[M]").astype("datetime64[D]") == dates).astype(np.int64)
 
     # Here we extract some descriptive statistics that will be used in a table.
     stats_min = f"{final['total'].min():,.0f} on {final['total'].idxmin():%F}"
@@ -103,58 +236,78 @@ def plot_calendar(args):
     days_ticks = {0: "Monday", 1: "Tuesday", 2: "Wednesday",
                   3: "Thursday", 4: "Friday", 5: "Saturday", 6: "Sunday"}
 
-    # We will create a figure with 2 rows: A heatmap and a table.
+    # The figure grows 300 pixels for each extra year.
+    rows = len(years) + 1
+    height = 500 + 300 * (len(years) - 1)
+
+    # We will create a figure with a heatmap for each year and a table.
+    # With more than one year the panels need more space between them for the months.
     fig = make_subplots(
-        rows=2,
+        rows=rows,
         cols=1,
-        row_heights=[250, 150],
-        vertical_spacing=0.07,
-        specs=[
-            [{"type": "scatter"}],
-            [{"type": "table"}]
-        ]
+        row_heights=[250] * len(years) + [150],
+        vertical_spacing=0.07 if len(years) == 1 else 60 / (height - 120),
+        specs=[[{"type": "scatter"}] for _ in years] + [[{"type": "table"}]]
     )
 
-    # The first heatmap will be used to show the borders only.
-    # Notice the xgap # and ygap properties.
-    fig.add_trace(
-        go.Heatmap(
-            x=final["week"],
-            y=final["dayofweek"],
-            z=final["border"],
-            xgap=1,
-            ygap=12,
-            colorscale=["hsla(0, 100%, 100%, 0.0)",
-                        "hsla(0, 100%, 100%, 1.0)"],
-            showscale=False,
-        ), col=1, row=1
-    )
+    # The colorbar spans all the panels.
+    top = fig.layout.yaxis.domain[1]
+    bottom = fig.layout[f"yaxis{len(years)}" if len(years) > 1 else "yaxis"].domain[0]
+
+    for row, year in enumerate(years, start=1):
+        panel = final[final["year"] == year]
+
+        # The first heatmap will be used to show the borders only.
+        # Notice the xgap # and ygap properties.
+        fig.add_trace(
+            go.Heatmap(
+                x=panel["week"],
+                y=panel["dayofweek"],
+                z=panel["border"],
+                xgap=1,
+                ygap=12,
+                zmin=0,
+                zmax=1,
+                colorscale=["hsla(0, 100%, 100%, 0.0)",
+                            "hsla(0, 100%, 100%, 1.0)"],
+                showscale=False,
+            ), col=1, row=row
+        )
 
-    # We will add a heatmap above the previous one with the real values.
-    # Again, notice the xgap and ygap values, with that trick we can have
-    # borders.
-    fig.add_trace(
-        go.Heatmap(
-            x=final["week"],
-            y=final["dayofweek"],
-            z=final["total"],
-            xgap=5,
-            ygap=16,
-            colorscale="speed_r",
-            colorbar={
-                "y": 0.6,
-                "ticks": "outside",
-                "outlinewidth": 2,
-                "thickness": 20,
-                "outlinecolor": "#FFFFFF",
-                "tickwidth": 2,
-                "tickcolor": "#FFFFFF",
-                "ticklen": 10,
-                "tickfont_size": 16,
-                "separatethousands": True
-            }
-        ), col=1, row=1
-    )
+        # We will add a heatmap above the previous one with the real values.
+        # Again, notice the xgap and ygap values, with that trick we can have
+        # borders. All the panels share the same colors, so only the first one
+        # shows the colorbar.
+        fig.add_trace(
+            go.Heatmap(
+                x=panel["week"],
+                y=panel["dayofweek"],
+                z=panel["total"],
+                xgap=5,
+                ygap=16,
+                zmin=final["total"].min(),
+                zmax=final["total"].max(),
+                colorscale="speed_r",
+                showscale=row == 1,
+                colorbar={
+                    "y": 0.6 if len(years) == 1 else (top + bottom) / 2,
+                    "len": 1 if len(years) == 1 else top - bottom,
+                    "ticks": "outside",
+                    "outlinewidth": 2,
+                    "thickness": 20,
+                    "outlinecolor": "#FFFFFF",
+                    "tickwidth": 2,
+                    "tickcolor": "#FFFFFF",
+                    "ticklen": 10,
+                    "tickfont_size": 16,
+                    "separatethousands": True
+                }
+            ), col=1, row=row
+        )
+
+        # With more than one panel we label each one with its year.
+        if len(years) > 1:
+            fig.update_yaxes(title_text=f"<b>{year}</b>", row=row, col=1)
 
     # Finally we add a simple table with the descriptive statistics.
     fig.add_trace(
@@ -183,14 +336,14 @@ def plot_calendar(args):
                 line_width=0.8,
                 align="center"
             )
-        ), col=1, row=2
+        ), col=1, row=rows
     )
 
     fig.update_xaxes(
         title="",
         side="top",
         tickfont_size=20,
-        range=[-1, 53],
+        range=[-1, max(53, final["week"].max() + 1)],
         ticktext=months_labels,
         tickvals=months_ticks,
         ticks="outside",
@@ -223,13 +376,13 @@ def plot_calendar(args):
     fig.update_layout(
         showlegend=False,
         width=1280,
-        height=500,
+        height=height,
         font_family="Jura",
         font_color="#FFFFFF",
         font_size=20,
-        title_text=f"Distribution of submissions in r/{args.r} during {year} by date (UTC)",
+        title_text=f"Distribution of submissions in r/{args.r} {period(args)} by date ({time_zone(args)})",
         title_x=0.5,
-        title_y=0.93,
+        title_y=(height - 35) / height,
         margin_t=120,
         margin_l=120,
         margin_r=140,
@@ -240,7 +393,7 @@ def plot_calendar(args):
         annotations=[
             dict(
                 x=0.01,
-                y=0.04,
+                y=20 / height,
                 xref="paper",
                 yref="paper",
                 xanchor="left",
@@ -249,7 +402,7 @@ def plot_calendar(args):
             ),
             dict(
                 x=0.5,
-                y=0.04,
+                y=20 / height,
                 xref="paper",
                 yref="paper",
                 xanchor="center",
@@ -258,7 +411,7 @@ def plot_calendar(args):
             ),
             dict(
                 x=1.01,
-                y=0.04,
+                y=20 / height,
                 xref="paper",
                 yref="paper",
                 xanchor="right",
@@ -268,33 +421,22 @@ def plot_calendar(args):
         ]
     )
 
-    fig.write_image("./1.png")
+    return fig
 
 
-def plot_radar(args):
+def plot_radar(totals, args):
     """
     This function creates a radar chart that shows the distribution
     by hour of the day.
-    """
-
-    # We read our CSV file and make the isodate column our index.
-    df = pd.read_csv(
-        f"./{args.r}-{args.yr}.csv",
-        parse_dates=["isodate"],
-        index_col="isodate"
-    )
 
-    # For this plot We only need the hour, we extract it from the datetime index.
-    df["hour"] = df.index.hour
+    It takes the totals by hour from dataset.aggregate() and returns the figure.
+    """
 
-    # We extract the value counts of each hour found into a Series.
-    totals = df["hour"].value_counts().sort_index()
+    import pandas as pd
+    import plotly.graph_objects as go
 
-    # In order for the radar plot to work we need to create a 'skeleton' with all
-    # the hours in the day (0-23).
-    # We create this skeleton using a simple range. Then we will add the previously
-    # created Series as the 'total' column.
-    final = pd.DataFrame(index=np.arange(24), data={"total": totals})
+    # The totals already contain all the hours in the day (0-23).
+    final = pd.DataFrame(data={"total": totals})
 
     # To make the radar plot work we need to use categorical data for our
     # angular axis.
@@ -308,9 +450,6 @@ def plot_radar(args):
     # This is so the polygon can be closed, otherwise it will show a hole.
     final.loc[24] = final.iloc[0]
 
-    # Fill NA values with 0, othersise you will have holes in the polygon.
-    final["total"].fillna(0, inplace=True)
-
     fig = go.Figure()
 
     fig.add_traces(
@@ -354,7 +493,7 @@ def plot_radar(args):
         font_family="Jura",
         font_color="#FFFFFF",
         font_size=16,
-        title_text=f"Distribution of submissions in r/{args.r} during {args.yr} by hour (UTC)",
+        title_text=f"Distribution of submissions in r/{args.r} {period(args)} by hour ({time_zone(args)})",
         title_x=0.5,
         title_y=0.96,
         margin_t=120,
@@ -384,32 +523,22 @@ def plot_radar(args):
             ),
         ])
 
-    fig.write_image(f"./2.png")
+    return fig
 
 
-def plot_bars(args):
+def plot_bars(totals, args):
     """
     This function creates a simple vertical bar chart with the distribution by month.
-    """
-
-    # We read our CSV file and make the isodate column our index.
-    df = pd.read_csv(
-        f"./{args.r}-{args.yr}.csv",
-        parse_dates=["isodate"],
-        index_col="isodate"
-    )
 
-    # For this plot We only need the month, we extract it from the datetime index.
-    df["month"] = df.index.month
+    It takes the totals by month from dataset.aggregate() and returns the figure.
+    """
 
-    # We extract the value counts of each month found into a Series.
-    totals = df["month"].value_counts().sort_index()
+    import pandas as pd
+    import plotly.graph_objects as go
 
-    # It is not strictly neccesary to create the skeleton for this plot
-    # but I prefer to plot all the months eveh if we don't have data for them
+    # The totals contain all the months even if we don't have data for them
     # as some people can get confused by the missing months.
-    # we will use a simple range and add the 'total' column with the previous Series.
-    final = pd.DataFrame(index=np.arange(1, 13), data={"total": totals})
+    final = pd.DataFrame(data={"total": totals})
 
     # Hard-coded abbreviations of the months.
     months_ticks = {1: "Jan", 2: "Feb", 3: "Mar", 4: "Apr",
@@ -472,7 +601,7 @@ def plot_bars(args):
         font_family="Jura",
         font_color="#FFFFFF",
         font_size=18,
-        title_text=f"Distribution of submissions in r/{args.r} during {args.yr} by month (UTC)",
+        title_text=f"Distribution of submissions in r/{args.r} {period(args)} by month ({time_zone(args)})",
         title_x=0.5,
         title_y=0.965,
         margin_t=60,
@@ -503,34 +632,27 @@ def plot_bars(args):
             )
         ])
 
-    fig.write_image("./3.png")
+    return fig
 
 
-def plot_donut(args):
+def plot_donut(totals, args):
     """
     This function creates a donut plot with a gauge effect
-    # that shows the distribution by day of the week.
-    """
-
-    # We read our CSV file and make the isodate column our index.
-    df = pd.read_csv(
-        f"./{args.r}-{args.yr}.csv",
-        parse_dates=["isodate"],
-        index_col="isodate"
-    )
+    that shows the distribution by day of the week.
 
-    # For this plot We only need the day of the week, we extract it from the datetime index.
-    df["weekday"] = df.index.weekday
+    It takes the totals by day of the week from dataset.aggregate() and returns the figure.
+    """
 
-    # We extract the value counts of each day of the week found into a Series.
-    totals = df["weekday"].value_counts().sort_index()
+    import pandas as pd
+    import plotly.graph_objects as go
+    from plotly.colors import qualitative
 
     # Hard-coded names of the days of the week.
     days = {0: "Monday", 1: "Tuesday", 2: "Wednesday",
             3: "Thursday", 4: "Friday", 5: "Saturday", 6: "Sunday"}
 
-    # The skeleton doesn't matter for this kind of plot, but we will use it for consistency. :P
-    final = pd.DataFrame(index=np.arange(7), data={"total": totals})
+    # The totals already contain all the days of the week (0-6).
+    final = pd.DataFrame(data={"total": totals})
 
     # We map the index to their respective labels.
     final.index = final.index.map(days)
@@ -574,7 +696,7 @@ def plot_donut(args):
         font_family="Jura",
         font_color="#FFFFFF",
         font_size=18,
-        title_text=f"Distribution of submissions in r/{args.r} during {args.yr} by day of the week (UTC)",
+        title_text=f"Distribution of submissions in r/{args.r} {period(args)} by day of the week ({time_zone(args)})",
         title_x=0.5,
         title_y=0.95,
         margin_t=100,
@@ -605,12 +727,724 @@ def plot_donut(args):
             )
         ])
 
-    fig.write_image("./4.png")
+    return fig
+
+
+def plot_authors(totals, args):
+    """
+    This function creates a horizontal bar chart with the authors with the most posts.
+
+    It takes the counts from dataset.top_authors() and returns the figure.
+    """
+
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    # We want the author with the most posts at the top of the chart.
+    final = pd.DataFrame(data={"total": totals}).iloc[::-1]
+
+    fig = go.Figure()
+
+    fig.add_trace(
+        go.Bar(
+            x=final["total"],
+            y=final.index,
+            orientation="h",
+            text=final["total"],
+            texttemplate="%{x:,.0f}",
+            textfont_size=16,
+            marker_line_width=0,
+            marker_color=final["total"],
+            marker_colorscale="portland_r",
+            textposition="outside"
+        )
+    )
+
+    fig.update_xaxes(
+        title="Total submissions",
+        range=[0, final["total"].max() * 1.1],
+        ticks="outside",
+        separatethousands=True,
+        tickfont_size=14,
+        ticklen=10,
+        title_standoff=6,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        gridwidth=0.5,
+        showline=True,
+        mirror=True
+    )
+
+    fig.update_yaxes(
+        title="",
+        ticks="outside",
+        tickfont_size=14,
+        ticklen=10,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        showline=True,
+        showgrid=False,
+        mirror=True
+    )
+
+    # The counts of the summary can be a bit lower than the real ones, we say how much.
+    error = totals.attrs.get("error", 0)
+    note = f"Counts can be up to {error:,} lower" if error else "Exact counts"
+
+    fig.update_layout(
+        showlegend=False,
+        width=1280,
+        height=720,
+        font_family="Jura",
+        font_color="#FFFFFF",
+        font_size=18,
+        title_text=f"Top {len(final)} authors in r/{args.r} {period(args)} by submissions",
+        title_x=0.5,
+        title_y=0.965,
+        margin_t=60,
+        margin_l=200,
+        margin_r=40,
+        margin_b=90,
+        title_font_size=24,
+        plot_bgcolor="#041C32",
+        paper_bgcolor="#04293A",
+        annotations=[
+            dict(
+                x=0.01,
+                y=-0.14,
+                xref="paper",
+                yref="paper",
+                xanchor="left",
+                yanchor="top",
+                text="Source: Pushshift API"
+            ),
+            dict(
+                x=0.5,
+                y=-0.14,
+                xref="paper",
+                yref="paper",
+                xanchor="center",
+                yanchor="top",
+                text=note
+            ),
+            dict(
+                x=1.01,
+                y=-0.14,
+                xref="paper",
+                yref="paper",
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita"
+            )
+        ])
+
+    return fig
+
+
+def plot_terms(totals, args):
+    """
+    This function creates two horizontal bar charts with the most common
+    words and bigrams in the titles.
+
+    It takes the counts from dataset.top_terms() and returns the figure.
+    """
+
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    fig = make_subplots(
+        rows=1,
+        cols=2,
+        horizontal_spacing=0.2,
+        subplot_titles=["Words", "Bigrams"]
+    )
+
+    for col, kind in enumerate(["word", "bigram"], start=1):
+        # We want the most common term at the top of the chart.
+        # Short titles can have no bigrams at all, so we don't index by the kind directly.
+        final = totals[totals.index.get_level_values(0) == kind].droplevel(0).iloc[::-1]
+
+        fig.add_trace(
+            go.Bar(
+                x=final,
+                y=final.index,
+                orientation="h",
+                text=final,
+                texttemplate="%{x:,.0f}",
+                textfont_size=14,
+                marker_line_width=0,
+                marker_color=final,
+                marker_colorscale="portland_r",
+                textposition="outside"
+            ), col=col, row=1
+        )
+
+        fig.update_xaxes(range=[0, max(final.max(), 1) * 1.2], col=col, row=1)
+
+    fig.update_xaxes(
+        title="Total titles",
+        ticks="outside",
+        separatethousands=True,
+        tickfont_size=14,
+        ticklen=10,
+        title_standoff=6,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        gridwidth=0.5,
+        showline=True,
+        nticks=6,
+        mirror=True
+    )
+
+    fig.update_yaxes(
+        ticks="outside",
+        tickfont_size=14,
+        ticklen=10,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        showline=True,
+        showgrid=False,
+        mirror=True
+    )
+
+    fig.update_layout(
+        showlegend=False,
+        width=1280,
+        height=720,
+        font_family="Jura",
+        font_color="#FFFFFF",
+        font_size=18,
+        title_text=f"Most common terms in the titles of r/{args.r} {period(args)}",
+        title_x=0.5,
+        title_y=0.965,
+        margin_t=90,
+        margin_l=160,
+        margin_r=40,
+        margin_b=90,
+        title_font_size=24,
+        plot_bgcolor="#041C32",
+        paper_bgcolor="#04293A"
+    )
+
+    # The subplot titles are annotations too, so we add ours after them.
+    fig.add_annotation(
+        x=0.01,
+        y=-0.14,
+        xref="paper",
+        yref="paper",
+        xanchor="left",
+        yanchor="top",
+        showarrow=False,
+        text="Source: Pushshift API"
+    )
+
+    fig.add_annotation(
+        x=1.01,
+        y=-0.14,
+        xref="paper",
+        yref="paper",
+        xanchor="right",
+        yanchor="top",
+        showarrow=False,
+        text="🧁 @lapanquecita"
+    )
+
+    return fig
+
+
+def plot_heatmap(totals, args):
+    """
+    This function creates a heatmap with the distribution by
+    day of the week (rows) and hour of the day (columns).
+
+    It takes the totals by day of the week and hour from dataset.aggregate() and returns the figure.
+    """
+
+    import plotly.graph_objects as go
+
+    # Hard-coded names of the days of the week for the y-axis.
+    days = {0: "Monday", 1: "Tuesday", 2: "Wednesday",
+            3: "Thursday", 4: "Friday", 5: "Saturday", 6: "Sunday"}
+
+    fig = go.Figure()
+
+    # Like in the calendar plot, the gaps between the cells work as borders.
+    fig.add_trace(
+        go.Heatmap(
+            x=totals.columns,
+            y=totals.index,
+            z=totals.to_numpy(),
+            xgap=3,
+            ygap=3,
+            texttemplate="%{z:,.0f}",
+            textfont_size=11,
+            colorscale="speed_r",
+            colorbar={
+                "ticks": "outside",
+                "outlinewidth": 2,
+                "thickness": 20,
+                "outlinecolor": "#FFFFFF",
+                "tickwidth": 2,
+                "tickcolor": "#FFFFFF",
+                "ticklen": 10,
+                "tickfont_size": 16,
+                "separatethousands": True
+            }
+        )
+    )
+
+    fig.update_xaxes(
+        title="Hour of the day",
+        tickvals=list(totals.columns),
+        ticks="outside",
+        ticklen=10,
+        zeroline=False,
+        title_standoff=20,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        showline=True,
+        showgrid=False,
+        mirror=True
+    )
+
+    # Monday is shown at the top.
+    fig.update_yaxes(
+        autorange="reversed",
+        ticktext=list(days.values()),
+        tickvals=list(days.keys()),
+        ticks="outside",
+        tickfont_size=16,
+        ticklen=10,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        showline=True,
+        zeroline=False,
+        showgrid=False,
+        mirror=True
+    )
+
+    fig.update_layout(
+        showlegend=False,
+        width=1280,
+        height=720,
+        font_family="Jura",
+        font_color="#FFFFFF",
+        font_size=18,
+        title_text=f"Distribution of submissions in r/{args.r} {period(args)} by day of the week and hour ({time_zone(args)})",
+        title_x=0.5,
+        title_y=0.965,
+        margin_t=60,
+        margin_l=140,
+        margin_r=40,
+        margin_b=90,
+        title_font_size=24,
+        plot_bgcolor="#041C32",
+        paper_bgcolor="#04293A",
+        annotations=[
+            dict(
+                x=0.01,
+                y=-0.14,
+                xref="paper",
+                yref="paper",
+                xanchor="left",
+                yanchor="top",
+                text="Source: Pushshift API"
+            ),
+            dict(
+                x=1.01,
+                y=-0.14,
+                xref="paper",
+                yref="paper",
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita"
+            )
+        ])
+
+    return fig
+
+
+def plot_activity(totals, args):
+    """
+    This function creates a line chart with the submissions of each hour (or minute)
+    and their rolling average.
+
+    It takes the series from dataset.activity() and returns the figure. Long series
+    were already downsampled there, so each point can cover several hours (or minutes).
+    """
+
+    import plotly.graph_objects as go
+
+    bucket = totals.attrs.get("bucket", 1)
+    unit = args.resolution
+
+    # The legend says how many hours (or minutes) each point covers.
+    if bucket > 1:
+        unit_text = f"{unit} (average of {bucket:,} {unit}s per point)"
+    else:
+        unit_text = unit
+
+    fig = go.Figure()
+
+    # The maximum of each point is drawn first, so the average covers it.
+    if bucket > 1:
+        fig.add_trace(
+            go.Scatter(
+                x=totals.index,
+                y=totals["peak"],
+                name=f"Maximum per {unit}",
+                mode="lines",
+                line_width=1,
+                line_color="hsla(73, 100%, 70%, 0.35)"
+            )
+        )
+
+    fig.add_trace(
+        go.Scatter(
+            x=totals.index,
+            y=totals["total"],
+            name=f"Submissions per {unit_text}",
+            mode="lines",
+            line_width=1.5,
+            line_color="hsl(195, 100%, 60%)",
+            fill="tozeroy",
+            fillcolor="hsla(195, 100%, 60%, 0.15)"
+        )
+    )
+
+    fig.add_trace(
+        go.Scatter(
+            x=totals.index,
+            y=totals["rolling"],
+            name=f"Rolling average ({args.rolling})",
+            mode="lines",
+            line_width=4,
+            line_color="hsl(35, 100%, 60%)"
+        )
+    )
+
+    fig.update_xaxes(
+        ticks="outside",
+        ticklen=10,
+        zeroline=False,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        showline=True,
+        showgrid=False,
+        mirror=True
+    )
+
+    fig.update_yaxes(
+        title=f"Submissions per {unit}",
+        rangemode="tozero",
+        ticks="outside",
+        separatethousands=True,
+        tickfont_size=14,
+        ticklen=10,
+        title_standoff=6,
+        tickcolor="#FFFFFF",
+        linewidth=2,
+        gridwidth=0.5,
+        showline=True,
+        nticks=20,
+        mirror=True
+    )
+
+    fig.update_layout(
+        showlegend=True,
+        legend_orientation="h",
+        legend_x=0.5,
+        legend_y=-0.08,
+        legend_xanchor="center",
+        legend_yanchor="top",
+        width=1280,
+        height=720,
+        font_family="Jura",
+        font_color="#FFFFFF",
+        font_size=18,
+        title_text=f"Activity of r/{args.r} {period(args)} by {args.resolution} ({time_zone(args)})",
+        title_x=0.5,
+        title_y=0.965,
+        margin_t=60,
+        margin_l=100,
+        margin_r=40,
+        margin_b=140,
+        title_font_size=24,
+        plot_bgcolor="#041C32",
+        paper_bgcolor="#04293A",
+        annotations=[
+            dict(
+                x=0.01,
+                y=-0.22,
+                xref="paper",
+                yref="paper",
+                xanchor="left",
+                yanchor="top",
+                text="Source: Pushshift API"
+            ),
+            dict(
+                x=1.01,
+                y=-0.22,
+                xref="paper",
+                yref="paper",
+                xanchor="right",
+                yanchor="top",
+                text="🧁 @lapanquecita"
+            )
+        ])
+
+    return fig
+
+
+# Each plot function with the key of the totals it needs and its file name.
+PLOTS = {
+    "calendar": (plot_calendar, "date", "1.png"),
+    "radar": (plot_radar, "hour", "2.png"),
+    "bars": (plot_bars, "month", "3.png"),
+    "donut": (plot_donut, "weekday", "4.png"),
+    "authors": (plot_authors, "authors", "5.png"),
+    "terms": (plot_terms, "terms", "6.png"),
+    "heatmap": (plot_heatmap, "weekday_hour", "7.png"),
+    "activity": (plot_activity, "activity", "8.png")
+}
+
+
+def call_with_timeout(func, timeout, *args, **kwargs):
+    """
+    This function runs func in a separate thread and returns its result. It raises
+    the exception of func, or a TimeoutError if it didn't finish in time.
+    """
+
+    result = dict()
+
+    def target():
+        try:
+            result["value"] = func(*args, **kwargs)
+        except BaseException as exc:
+            result["error"] = exc
+
+    # A daemon thread doesn't keep the process alive if func never returns.
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+
+    if thread.is_alive():
+        raise TimeoutError(f"{getattr(func, '__name__', 'kaleido')} didn't finish in {timeout} seconds")
+
+    if "error" in result:
+        raise result["error"]
+
+    return result.get("value")
+
+
+def warm_up():
+    """
+    This function exports a tiny image, it makes sure kaleido and the browser work.
+    """
+
+    import plotly.graph_objects as go
+
+    go.Figure().to_image(format="png", width=10, height=10)
+
+
+def start_worker():
+    """
+    This function starts a long-lived kaleido instance in the current process,
+    this way each image doesn't have to pay for a cold start of the browser.
+
+    It is used as the initializer of the worker processes.
+    """
+
+    import kaleido
+
+    # Older versions of kaleido don't have a server, plotly reuses their scope anyway.
+    if not hasattr(kaleido, "start_sync_server"):
+        return
+
+    kaleido.start_sync_server(silence_warnings=True)
+
+    # If the browser can't start, the server fails in its background thread and every
+    # export after that waits forever. We try a tiny export first to find out.
+    try:
+        call_with_timeout(warm_up, WARM_UP_TIMEOUT)
+    except Exception:
+        call_with_timeout(kaleido.stop_sync_server, WARM_UP_TIMEOUT, silence_warnings=True)
+
+        # Without the server each image starts its own browser. If that doesn't work
+        # either, its error (e.g. Chrome is missing) is raised here instead of hanging.
+        call_with_timeout(warm_up, WARM_UP_TIMEOUT)
+        return
+
+    # Worker processes don't run atexit handlers, so we use a multiprocessing finalizer.
+    Finalize(None, kaleido.stop_sync_server, kwargs={
+             "silence_warnings": True}, exitpriority=10)
+
+
+def render_plot(name, totals, args, plots=PLOTS):
+    """
+    This function builds a single plot of the plots registry and exports it to the output folder.
+
+    It returns the stages recorded by this process, so the worker
+    processes can send them back to the main one.
+    """
+
+    if args.timings or args.profile:
+        instrument.enable(args.profile)
+
+    # Worker processes can inherit the stages of the main one, we only return the new ones.
+    first = len(instrument.STAGES)
+
+    func, _, filename = plots[name]
+
+    # The comparison plots have a DataFrame, so we add up all of its values.
+    with stage(f"build_{name}", int(totals.to_numpy().sum())):
+        fig = func(totals, args)
+
+    path = os.path.join(args.output, filename)
+
+    # The images that didn't change since a previous run are copied from the cache.
+    with stage(f"export_{name}") as record:
+        if args.no_cache:
+            fig.write_image(path)
+        else:
+            import render_cache
+
+            record["cached"] = render_cache.write_image(
+                fig, path, args.cache, args.cache_size * 1024 * 1024)
+
+    return instrument.collect(first)
+
+
+def render(totals, args, executor=None, plots=PLOTS):
+    """
+    This function builds and exports the plots selected in args.plots,
+    compare.py passes its own registry of plots.
+
+    If an executor is given the plots are exported concurrently in its
+    worker processes, otherwise they are exported one by one.
+    """
+
+    os.makedirs(args.output, exist_ok=True)
+
+    futures = list()
+
+    for name in args.plots:
+        key = plots[name][1]
+
+        if executor is None:
+            instrument.STAGES.extend(render_plot(name, totals[key], args, plots))
+        else:
+            futures.append(executor.submit(render_plot, name, totals[key], args, plots))
+
+    # We wait for all the images, this also raises any error from the workers.
+    for future in futures:
+        instrument.STAGES.extend(future.result())
+
+
+def check_plots(args):
+    """
+    This function raises a ValueError if the selected plots can't be created
+    from the selected data (a range of dates or the database), or if --tz
+    can't be used with its dates.
+    """
+
+    time_zone(args)
+
+    if date_range(args) is None and not args.db:
+        return
+
+    if {"authors", "terms"} & set(args.plots):
+        raise ValueError("the authors and terms plots are only available for the data file of a single year")
+
+    if "activity" in args.plots and args.resolution == "minute":
+        raise ValueError("the activity plot by minute is only available for the data file of a single year")
+
+
+def load_data(args, executor=None, jobs=1):
+    """
+    This function reads the data files and returns the totals of all the selected plots.
+
+    The totals by date, hour, month and day of the week are always computed, they come
+    from the same counts. The authors and the terms of the titles need their own pass
+    over the data file, so they are only read when their plots were selected.
+
+    It raises a ValueError if the plots can't be created, see check_plots().
+    """
+
+    from dataset import (activity, find_data, load_minutes, load_range_totals, load_totals,
+                         top_authors, top_terms)
+
+    check_plots(args)
+
+    # A range of dates reads the data file of each year in it.
+    dates = date_range(args)
+
+    # With --low-memory all the data files are read in chunks, whatever their size.
+    out_of_core = 0 if args.low_memory else args.out_of_core * 1024 * 1024
+
+    # The database counts the posts of any range of dates with a single query.
+    if args.db:
+        import store
+
+        totals = store.load_totals(args.db, args.r, *(dates or (f"{args.yr}-01-01", f"{args.yr}-12-31")), args.tz)
+    elif dates is None:
+        totals = load_totals(find_data(args.r, args.yr, args.data), args.yr, args.tz, out_of_core)
+    else:
+        totals = load_range_totals(args.r, *dates, args.data, args.tz, out_of_core)
+
+    # The hourly counts are already in the totals, the counts by minute need another pass.
+    if "activity" in args.plots:
+        if args.resolution == "minute":
+            counts = load_minutes(find_data(args.r, args.yr, args.data), args.yr, args.tz, out_of_core)
+        else:
+            counts = totals["hourly"]
+
+        with stage("activity", len(counts)):
+            totals["activity"] = activity(counts, args.rolling, args.max_points)
+
+    if "authors" in args.plots:
+        with stage("top_authors") as record:
+            totals["authors"] = top_authors(find_data(args.r, args.yr, args.data), args.top,
+                                            args.capacity, args.exact, args.low_memory, out_of_core)
+            record["rows"] = totals["authors"].attrs["rows"]
+
+    # The titles are split in chunks and counted by the worker processes.
+    if "terms" in args.plots:
+        with stage("top_terms") as record:
+            totals["terms"] = top_terms(find_data(args.r, args.yr, args.data), args.top, executor, jobs)
+            record["rows"] = totals["terms"].attrs["rows"]
+
+    return totals
 
 
 if __name__ == "__main__":
 
-    plot_calendar(args)
-    plot_radar(args)
-    plot_bars(args)
-    plot_donut(args)
+    args = arg.parse_args()
+
+    # The options are checked before any worker process is started.
+    try:
+        check_plots(args)
+    except ValueError as exc:
+        arg.error(str(exc))
+
+    if args.timings or args.profile:
+        instrument.enable(args.profile)
+
+    # The term counts use all the workers, the export alone doesn't need more workers than plots.
+    workers = args.jobs if "terms" in args.plots else min(args.jobs, len(args.plots))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=start_worker) as executor:
+            render(load_data(args, executor, workers), args, executor)
+    else:
+        start_worker()
+        render(load_data(args), args)
+
+    if args.timings:
+        instrument.save(args.timings, script="plotter", args=vars(args))
+
+    # The worker processes export the images and count the terms of the titles,
+    # their peak is known once the pool is closed.
+    if args.low_memory and instrument.peak_rss() is not None:
+        print(f"Peak memory: {instrument.peak_rss():,.1f} MB "
+              f"(worker processes: {instrument.peak_rss(children=True):,.1f} MB)")
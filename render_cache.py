@@ -0,0 +1,99 @@
+"""
+This module keeps a cache of the exported images, so a plot whose
+data and configuration didn't change is not exported again by kaleido.
+
+The images are saved with the hash of the figure (its data, layout and
+size) as their name. When the cache is larger than its maximum size the
+least recently used images are deleted.
+"""
+
+import hashlib
+import os
+import shutil
+
+
+def cache_key(fig, extension):
+    """
+    This function returns the hash of the figure and the image format.
+
+    The figure JSON has the data and the whole layout, including the
+    width and height of the image. The plotly version is included too
+    as a new version can draw the same figure in a different way.
+    """
+
+    import plotly
+
+    content = f"{plotly.__version__}\n{extension}\n{fig.to_json()}"
+
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def evict(folder, max_bytes, suffix=""):
+    """
+    This function deletes the least recently used files until the cache fits in max_bytes.
+
+    Only the files whose names end with suffix are counted and deleted, this is
+    also used by response_cache.py for the posts of the recent windows.
+    """
+
+    files = list()
+
+    for name in os.listdir(folder):
+        if not name.endswith(suffix):
+            continue
+
+        path = os.path.join(folder, name)
+
+        # Other processes can delete the files at the same time.
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    total = sum(size for _, size, _ in files)
+
+    for _, size, path in sorted(files):
+        if total <= max_bytes:
+            break
+
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+        total -= size
+
+
+def write_image(fig, path, folder, max_bytes):
+    """
+    This function saves the figure as an image, using the cached image when there is one.
+
+    It returns True if the image came from the cache.
+    """
+
+    extension = os.path.splitext(path)[1]
+
+    os.makedirs(folder, exist_ok=True)
+    cached = os.path.join(folder, cache_key(fig, extension) + extension)
+
+    if os.path.exists(cached):
+        shutil.copyfile(cached, path)
+
+        # We update the modification time, it is used to find the least recently used images.
+        os.utime(cached)
+
+        return True
+
+    fig.write_image(path)
+
+    # We copy the image to a temporary file and then rename it, this way
+    # other processes never see a half-written image.
+    temporary = f"{cached}.{os.getpid()}.tmp"
+    shutil.copyfile(path, temporary)
+    os.replace(temporary, cached)
+
+    evict(folder, max_bytes)
+
+    return False
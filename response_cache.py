@@ -0,0 +1,155 @@
+"""
+This module keeps a cache of the posts downloaded by scraper.py, so a
+time window that was already downloaded is read from the disk instead
+of asking the Pushshift API again.
+
+Each time window is saved as a compressed file with one post per line,
+its name is the hash of the server, subreddit, time span and fields.
+
+The posts of a window that ended a while ago won't change anymore, so these
+files never expire. The files of recent windows expire after a TTL and,
+when they take more than the maximum size, the oldest ones are deleted.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+from render_cache import evict
+
+
+# Pushshift can take a while to collect new posts, a window is only
+# considered finished once this many seconds have passed since its end.
+SETTLED = 2 * 86400
+
+# Only the files of the recent windows are deleted when the cache is too large.
+RECENT = ".recent.jsonl.gz"
+
+
+def cache_key(params):
+    """
+    This function returns the hash of the search parameters.
+    """
+
+    content = json.dumps(params, sort_keys=True)
+
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def is_fresh(path, past, ttl):
+    """
+    This function tells if a cached window can be used. The past windows
+    are always valid, the recent ones only during ttl seconds.
+    """
+
+    # Other processes can delete the files at the same time.
+    try:
+        modified = os.path.getmtime(path)
+    except FileNotFoundError:
+        return False
+
+    return past or time.time() - modified < ttl
+
+
+def entry_path(folder, params):
+    """
+    This function returns the path of the cached window of a search
+    and whether the window is in the past (so it never expires).
+    """
+
+    past = params["until"] <= time.time() - SETTLED
+    path = os.path.join(folder, cache_key(params) + (".past.jsonl.gz" if past else RECENT))
+
+    return path, past
+
+
+def read(path):
+    """
+    This function yields the posts of a cached window.
+    """
+
+    with gzip.open(path, "rt", encoding="utf-8") as cache_file:
+        for line in cache_file:
+            yield json.loads(line)
+
+
+@contextmanager
+def recording(path):
+    """
+    This context manager opens a temporary file where the posts of a window are written,
+    the file is only added to the cache if the block finishes without errors. This way
+    an interrupted download never leaves a partial file.
+    """
+
+    temporary = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        with gzip.open(temporary, "wt", encoding="utf-8") as cache_file:
+            yield cache_file
+
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def search(folder, params, search_func, ttl, max_bytes):
+    """
+    This function yields the posts of a search, from the cache when possible.
+
+    Otherwise it yields the posts of search_func() as they arrive and saves them
+    to the cache at the same time.
+    """
+
+    os.makedirs(folder, exist_ok=True)
+
+    path, past = entry_path(folder, params)
+
+    if is_fresh(path, past, ttl):
+        yield from read(path)
+        return
+
+    with recording(path) as cache_file:
+        for item in search_func():
+            cache_file.write(json.dumps(item) + "\n")
+            yield item
+
+    if not past:
+        evict(folder, max_bytes, RECENT)
+
+
+async def search_pages(folder, params, pages_func, ttl, max_bytes, page_size=1000):
+    """
+    This function works like search() for the asyncio engine of fetcher.py,
+    pages_func() is an async generator and we yield lists of posts.
+    """
+
+    os.makedirs(folder, exist_ok=True)
+
+    path, past = entry_path(folder, params)
+
+    if is_fresh(path, past, ttl):
+        page = list()
+
+        for item in read(path):
+            page.append(item)
+
+            if len(page) >= page_size:
+                yield page
+                page = list()
+
+        if page:
+            yield page
+
+        return
+
+    with recording(path) as cache_file:
+        async for page in pages_func():
+            cache_file.writelines(json.dumps(item) + "\n" for item in page)
+            yield page
+
+    if not past:
+        evict(folder, max_bytes, RECENT)
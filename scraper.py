@@ -3,11 +3,27 @@ This script downloads all the posts from the specified subreddit and year.
 """
 
 import argparse
+import asyncio
 import csv
-from datetime import datetime
+import heapq
+import json
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
 
+import numpy as np
 from pmaw import PushshiftAPI
 
+import fetcher
+import id_index
+import instrument
+import response_cache
+import store
+from dataset import REDDIT_URL, count_hours, rollup_path, save_rollup, to_local, year_bounds
+from instrument import stage
+
 # Used it for parsing default year
 x = datetime.now()
 
@@ -21,55 +37,864 @@ arg.add_argument("-yr", "--yr",
                  type=int,
                  default=x.year,
                  help=" takes in required Year")
-args = arg.parse_args()
+arg.add_argument("-f", "--format",
+                 choices=["csv", "npy", "sqlite"],
+                 default="csv",
+                 help=" output format, npy saves the timestamps in a separate binary file and sqlite adds the posts to --db")
+arg.add_argument("--db",
+                 type=str,
+                 default=None,
+                 help=" SQLite database used by -f sqlite, reddit.db in the output folder by default")
+arg.add_argument("-e", "--epoch",
+                 action="store_true",
+                 help=" saves the created_utc epochs instead of ISO dates in the CSV file")
+arg.add_argument("-c", "--chunk-size",
+                 type=int,
+                 default=100_000,
+                 help=" maximum number of posts kept in memory before saving them to disk")
+arg.add_argument("-k", "--checkpoint",
+                 action="store_true",
+                 help=" saves the progress after each month and resumes from it if interrupted")
+arg.add_argument("-u", "--update",
+                 action="store_true",
+                 help=" only downloads the posts newer than the ones in the existing output file")
+arg.add_argument("-w", "--window",
+                 choices=["month", "week", "day"],
+                 default="month",
+                 help=" size of the time windows the year is split into")
+arg.add_argument("-j", "--jobs",
+                 type=int,
+                 default=4,
+                 help=" number of time windows downloaded at the same time")
+arg.add_argument("--rate-limit",
+                 type=int,
+                 default=60,
+                 help=" maximum number of requests per minute, shared by all the jobs")
+arg.add_argument("--engine",
+                 choices=["pmaw", "async"],
+                 default="pmaw",
+                 help=" download engine, async sends -j requests at the same time from a single process")
+arg.add_argument("--retries",
+                 type=int,
+                 default=5,
+                 help=" number of times a failed request is retried by the async engine")
+arg.add_argument("--endpoint",
+                 type=str,
+                 default=None,
+                 help=" base URL of a Pushshift compatible server, e.g. http://localhost:8000")
+arg.add_argument("-o", "--output",
+                 type=str,
+                 default=".",
+                 help=" folder where the data files are saved")
+arg.add_argument("--cache",
+                 type=str,
+                 default=".pushshift-cache",
+                 help=" folder where the downloaded posts of each time window are cached")
+arg.add_argument("--cache-ttl",
+                 type=int,
+                 default=3600,
+                 help=" seconds the cached posts of recent time windows are valid, the past ones never expire")
+arg.add_argument("--cache-size",
+                 type=int,
+                 default=1024,
+                 help=" maximum size in megabytes of the cached posts of recent time windows")
+arg.add_argument("--no-cache",
+                 action="store_true",
+                 help=" always downloads the posts, without using the cache")
+arg.add_argument("--timings",
+                 type=str,
+                 default=None,
+                 help=" saves the time, rows and peak memory of each stage to this JSON file")
+arg.add_argument("--profile",
+                 type=str,
+                 default=None,
+                 help=" saves a cProfile file for each stage to this folder")
+
+
+def year_epochs(year):
+    """
+    This function returns the epochs used to restrict by the year we are interested in,
+    the first second of the year and of the next one (not included).
+    """
+
+    return int(datetime(year, 1, 1).timestamp()), int(datetime(year + 1, 1, 1).timestamp())
+
+
+def output_path(args, suffix):
+    """
+    This function returns the path of an output file, e.g. ./Python-2021.csv
+    """
+
+    return os.path.join(args.output, f"{args.r}-{args.yr}{suffix}")
+
+
+def db_path(args):
+    """
+    This function returns the path of the SQLite database.
+    """
+
+    return args.db or os.path.join(args.output, "reddit.db")
+
+
+def append_previous(csv_file, path):
+    """
+    This function copies the rows of a previous CSV file (without its header)
+    to the end of an open CSV file.
+    """
+
+    with open(path, newline="", encoding="utf-8") as previous_file:
+        reader = csv.reader(previous_file)
+        next(reader, None)
+        csv.writer(csv_file).writerows(reader)
+
+
+def csv_header(args):
+    """
+    This function returns the header of the CSV file.
+    """
+
+    return ["created_utc" if args.epoch else "isodate", "author", "title", "permalink"]
+
+
+def write_csv(rows, args, previous=False):
+    """
+    This function saves the rows to a CSV file with the date in ISO format,
+    or with the created_utc epoch if args.epoch is set.
+
+    If previous is True the rows of the existing CSV file are added after the
+    new ones, this is used by the update mode.
+
+    It returns the counts by hour of the year of the saved rows.
+    """
+
+    path = output_path(args, ".csv")
+
+    start, end = year_bounds(args.yr)
+    first_day = datetime(args.yr, 1, 1).toordinal()
+    hourly = [0] * ((end - start) // 3600)
+
+    # We write to a temporary file and then replace the old one,
+    # this way an interrupted run never leaves a half-written file.
+    with open(path + ".tmp", "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(csv_header(args))
+
+        for timestamp, author, title, permalink in rows:
+
+            if args.epoch:
+                # The epochs are saved as they are, the hours are counted in UTC.
+                writer.writerow([timestamp, author, title, permalink])
+
+                hour = (timestamp - start) // 3600
+            else:
+                # We convert he date from a timestamp to ISO format.
+                # The dates are in local time, so the hours are counted the same way.
+                date = datetime.fromtimestamp(timestamp)
+                isodate = f"{date:%F %T}"
+
+                writer.writerow([isodate, author, title, permalink])
+
+                hour = (date.toordinal() - first_day) * 24 + date.hour
+
+            if 0 <= hour < len(hourly):
+                hourly[hour] += 1
+
+        if previous:
+            append_previous(csv_file, path)
+
+    os.replace(path + ".tmp", path)
+
+    return hourly
+
+
+def write_npy(rows, count, args, previous=False):
+    """
+    This function saves the timestamps (created_utc) to a .npy file and the
+    rest of the columns to a side CSV file, both in the same order.
+
+    The .npy file can be memory-mapped by plotter.py so it only reads the timestamps.
+    If previous is True the existing rows are added after the new ones.
+
+    'count' is the number of rows before merge_runs() drops the duplicates,
+    so there can be fewer rows.
+
+    It returns the counts by hour of the year of the saved rows.
+    """
+
+    path = output_path(args, ".npy")
+    start, end = year_bounds(args.yr)
+    posts_path = output_path(args, "-posts.csv")
+
+    old_timestamps = np.load(path, mmap_mode="r") if previous else np.empty(0, dtype=np.int64)
+
+    # We create the .npy file with its final size and fill it as the rows arrive,
+    # this way we never need all the timestamps in memory.
+    timestamps = np.lib.format.open_memmap(
+        path + ".tmp", mode="w+", dtype=np.int64, shape=(count + len(old_timestamps),))
+
+    written = 0
+
+    with open(posts_path + ".tmp", "w", newline="", encoding="utf-8") as csv_file:
+        writer = csv.writer(csv_file)
+        writer.writerow(["author", "title", "permalink"])
+
+        for row in rows:
+            timestamps[written] = row[0]
+            writer.writerow(row[1:])
+            written += 1
+
+        if previous:
+            append_previous(csv_file, posts_path)
+
+    # If some duplicates were dropped we copy the timestamps to a file of the right size.
+    # They are only posts returned twice by the API, so this is rare.
+    if written < count:
+        shorter = np.lib.format.open_memmap(
+            path + ".tmp2", mode="w+", dtype=np.int64, shape=(written + len(old_timestamps),))
+        shorter[:written] = timestamps[:written]
+
+        # A memory-mapped file can't be replaced on Windows, both maps are closed first.
+        shorter.flush()
+        del timestamps, shorter
+
+        os.replace(path + ".tmp2", path + ".tmp")
+        timestamps = np.load(path + ".tmp", mmap_mode="r+")
+
+    timestamps[written:] = old_timestamps
+
+    # The new rows are at the start of the file, we count them all at once.
+    new_timestamps = timestamps[:written]
+    new_timestamps = new_timestamps[(new_timestamps >= start) & (new_timestamps < end)]
+    hourly = np.bincount((new_timestamps - start) // 3600, minlength=(end - start) // 3600)
+
+    timestamps.flush()
+    del timestamps, old_timestamps, new_timestamps
+
+    os.replace(path + ".tmp", path)
+    os.replace(posts_path + ".tmp", posts_path)
+
+    return hourly
+
+
+def update_rollup(hourly, args, previous=False):
+    """
+    This function saves the hourly counts to the rollup of the output file.
+
+    In update mode the counts of the new rows are added to the existing rollup,
+    if there is no rollup yet plotter.py will create it from the whole file.
+    """
+
+    path = rollup_path(output_path(args, f".{args.format}"))
+
+    if previous:
+        if not os.path.exists(path):
+            return
+
+        hourly = np.load(path) + np.asarray(hourly, dtype=np.int64)
+
+    save_rollup(path, hourly)
+
+
+def newest_timestamp(args):
+    """
+    This function returns the timestamp of the newest post in the existing
+    output file, or None if there is no output file yet.
+    """
+
+    if args.format == "sqlite":
+        return store.newest_timestamp(db_path(args), args.r, *year_bounds(args.yr))
+
+    if args.format == "npy":
+        path = output_path(args, ".npy")
+
+        if not os.path.exists(path):
+            return None
+
+        timestamps = np.load(path, mmap_mode="r")
+        return int(timestamps[0]) if len(timestamps) else None
+
+    path = output_path(args, ".csv")
+
+    if not os.path.exists(path):
+        return None
+
+    # The file is sorted from newest to oldest, so we only need its first row.
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        reader = csv.reader(csv_file)
+        header = next(reader, None)
+        row = next(reader, None)
+
+    # The new rows can't be mixed with rows in the other date format.
+    if header != csv_header(args):
+        raise ValueError(f"{path} has a different format, use the same --epoch option it was created with")
+
+    if row is None:
+        return None
+
+    if args.epoch:
+        return int(row[0])
+
+    return int(datetime.strptime(row[0], "%Y-%m-%d %H:%M:%S").timestamp())
+
+
+def save_run(rows, folder, number):
+    """
+    This function sorts the rows from newest to oldest and saves them
+    to a temporary CSV file (a 'run'). It returns the name of the file.
+    """
+
+    rows.sort(reverse=True)
+
+    name = f"run-{number}.csv"
+
+    with open(os.path.join(folder, name), "w", newline="", encoding="utf-8") as csv_file:
+        csv.writer(csv_file).writerows(rows)
+
+    return name
+
+
+def read_run(path):
+    """
+    This function reads back the rows of a run, one at a time.
+    """
+
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        for row in csv.reader(csv_file):
+            row[0] = int(row[0])
+            row[4] = int(row[4])
+            yield row
+
+
+def merge_runs(folder, names):
+    """
+    This function merges the sorted runs into a single stream of rows
+    from newest to oldest. Only one row per run is kept in memory.
+
+    A post can be in two runs of the same window (each chunk only drops its own
+    duplicates), its copies have the same date so they arrive one after the other.
+    We only keep the keys of the posts of the current second to drop them.
+    """
+
+    second = None
+    seen = set()
+
+    for row in heapq.merge(*[read_run(os.path.join(folder, name)) for name in names], reverse=True):
+        if row[0] != second:
+            second = row[0]
+            seen = set()
+
+        key = row_key(row)
+
+        if key in seen:
+            continue
+
+        seen.add(key)
+
+        yield row
+
+
+def split_ids(rows, ids, epochs=None):
+    """
+    This function yields the rows without their ids, the ids are saved in the ids array
+    (and the created_utc epochs in the epochs array, if there is one).
+    """
+
+    for index, row in enumerate(rows):
+        ids[index] = row[4]
+
+        if epochs is not None:
+            epochs[index] = row[0]
+
+        yield row[:4]
+
+
+def drop_known(rows, index):
+    """
+    This function removes the rows whose ids are already in the id index.
+    The whole chunk is looked up in the index at once.
+    """
+
+    if index is None or len(index) == 0:
+        return rows
+
+    known = id_index.contains(index, [row[4] for row in rows])
+
+    return [row for row, found in zip(rows, known) if not found]
+
+
+def load_checkpoint(folder):
+    """
+    This function returns the checkpoint saved in the folder, or None if there isn't one.
+    """
+
+    path = os.path.join(folder, "checkpoint.json")
+
+    if not os.path.exists(path):
+        return None
 
-# constant variables
-SUBREDDIT = args.r
-YEAR = args.yr
+    with open(path, encoding="utf-8") as json_file:
+        return json.load(json_file)
 
 
-# These are used to restrict by the year we are interested in.
-START_EPOCH = int(datetime(YEAR, 1, 1).timestamp())
-END_EPOCH = int(datetime(YEAR, 12, 31).timestamp())
+def save_checkpoint(folder, checkpoint):
+    """
+    This function saves the checkpoint to the folder.
+    """
 
+    path = os.path.join(folder, "checkpoint.json")
 
-def main():
+    with open(path + ".tmp", "w", encoding="utf-8") as json_file:
+        json.dump(checkpoint, json_file)
 
-    # This list will hold all the posts data.
-    data_list = [["isodate", "author", "title", "permalink"]]
+    os.replace(path + ".tmp", path)
 
-    # We initialize the Pushshift API and query our data.
-    api = PushshiftAPI()
 
-    gen = api.search_submissions(
-        subreddit=SUBREDDIT,
-        since=START_EPOCH,
-        until=END_EPOCH,
-        filter=["author", "title", "permalink"]
+def time_windows(since, until, size):
+    """
+    This function splits the time span in windows of one calendar month, week
+    (starting on Monday) or day. It yields (since, until) pairs of epochs.
+    """
+
+    date = datetime.fromtimestamp(since)
+    date = datetime(date.year, date.month, date.day)
+
+    while since < until:
+        if size == "month":
+            date = datetime(date.year + date.month // 12, date.month % 12 + 1, 1)
+        elif size == "week":
+            date += timedelta(days=7 - date.weekday())
+        else:
+            date += timedelta(days=1)
+
+        end = min(int(date.timestamp()), until)
+
+        yield since, end
+
+        since = end
+
+
+def to_row(item):
+    """
+    This function converts a post from the Pushshift API to a row.
+
+    The last item of the row is the id as an integer, it is only used
+    to drop duplicates and it is saved in the id index, not in the data file.
+    """
+
+    # We extract the values and prevent crashes for non-existing ones.
+    timestamp = item["created_utc"]
+    author = item.get("author", "")
+    title = item.get("title", "")
+    permalink = item.get("permalink", "")
+
+    if permalink != "":
+        permalink = REDDIT_URL + permalink
+
+    return [timestamp, author, title, permalink, id_index.decode(item.get("id", ""))]
+
+
+def row_key(row):
+    """
+    This function returns the key used to drop the duplicates of a row.
+    """
+
+    # Posts without an id (only a few very old ones) are compared by their date and permalink.
+    return row[4] or (row[0], row[3] or row[2])
+
+
+def main(args, executor=None, tz=None):
+    """
+    This function downloads the posts of the subreddit and year in args.
+
+    If an executor is given its worker processes are used to download
+    the time windows, otherwise a new pool is created.
+
+    It returns the counts by hour of the year of the new posts (None for
+    the sqlite format). If the file has UTC epochs they are counted in the
+    timezone tz, like dataset.load_hourly() does.
+    """
+
+    since = year_epochs(args.yr)[0]
+    previous = False
+
+    os.makedirs(args.output, exist_ok=True)
+
+    # In update mode we only download the posts newer than the ones we already have.
+    if args.update:
+        newest = newest_timestamp(args)
+
+        if newest is not None:
+            path = output_path(args, f".{args.format}")
+
+            # Files saved before the ids were recorded get their index from the permalinks,
+            # like the files whose index is older (an update interrupted before saving it).
+            # The database doesn't need one, it skips the posts it already has.
+            index = id_index.index_path(path)
+
+            if args.format != "sqlite" and \
+                    (not os.path.exists(index) or os.path.getmtime(index) < os.path.getmtime(path)):
+                with stage("build_index"):
+                    id_index.build(path)
+
+            # For the same reason the rollup may be missing some rows, we can't add
+            # the new counts to it. It is removed and plotter.py counts the whole file.
+            rollup = rollup_path(path)
+
+            if os.path.exists(rollup) and os.path.getmtime(rollup) < os.path.getmtime(path):
+                os.remove(rollup)
+
+            # We also download the second of the newest post, the posts of that same
+            # second that we already have are dropped by the id index (or the database).
+            since = newest
+            previous = True
+
+    if args.checkpoint:
+        # The progress is saved in this folder, if it already exists we resume from it.
+        folder = output_path(args, ".parts")
+        os.makedirs(folder, exist_ok=True)
+
+        hourly = fetch(folder, since, args, previous, executor, tz)
+
+        shutil.rmtree(folder)
+    else:
+        # The posts are saved in sorted runs inside this temporary folder,
+        # it is deleted once the final file is written.
+        with tempfile.TemporaryDirectory(prefix=f"{args.r}-{args.yr}-", dir=args.output) as folder:
+            hourly = fetch(folder, since, args, previous, executor, tz)
+
+    return hourly
+
+
+def fetch_window(folder, since, until, args, known=None):
+    """
+    This function downloads the posts of a single time window and saves them
+    as sorted runs. It returns the names of the runs, their number of rows and
+    the stages recorded by this worker process.
+
+    The posts whose ids are in the known id index are dropped.
+    """
+
+    if args.timings or args.profile:
+        instrument.enable(args.profile)
+
+    # Worker processes can inherit the stages of the main one, we only return the new ones.
+    first = len(instrument.STAGES)
+
+    with stage(f"window_{since}") as record:
+        runs, count = download_window(folder, since, until, args, known)
+        record["rows"] = count
+
+    return runs, count, instrument.collect(first)
+
+
+def download_window(folder, since, until, args, known=None):
+    """
+    This function does the actual work of fetch_window().
+    """
+
+    # Each job has its own client, the rate limit is split between them.
+    api = PushshiftAPI(
+        num_workers=max(1, 10 // args.jobs),
+        rate_limit=max(1, args.rate_limit // args.jobs)
     )
 
+    # This allows us to point the client to a local Pushshift compatible server.
+    if args.endpoint:
+        api._base_url = args.endpoint.rstrip("/") + "/{{endpoint}}"
+
+    params = search_params(since, until, args)
+
+    # mem_safe makes pmaw cache its responses on disk instead of keeping them in memory.
+    def search():
+        return api.search_submissions(**params, mem_safe=True, cache_dir=folder)
+
+    # The windows downloaded before are read from the response cache.
+    if args.no_cache:
+        gen = search()
+    else:
+        gen = response_cache.search(
+            args.cache, {**params, "endpoint": args.endpoint}, search,
+            args.cache_ttl, args.cache_size * 1024 * 1024)
+
+    window = WindowWriter(folder, since, until, args, known)
+
     # We iterate over each object in the generator.
     for item in gen:
+        if window.add(item):
+            window.save()
+
+    return window.close()
+
+
+def search_params(since, until, args):
+    """
+    This function returns the parameters of the search of a time window.
+    """
+
+    return {
+        "subreddit": args.r,
+        "since": since,
+        "until": until,
+        "filter": ["id", "author", "title", "permalink"]
+    }
+
+
+class WindowWriter:
+    """
+    This class receives the posts of a time window, drops the duplicates and
+    saves them as sorted runs of at most args.chunk_size rows.
+
+    Only the duplicates inside a chunk are dropped here, this way the memory used
+    doesn't grow with the window. The rest are dropped by merge_runs().
+    """
+
+    def __init__(self, folder, since, until, args, known=None):
+        self.folder = folder
+        self.since = since
+        self.until = until
+        self.chunk_size = args.chunk_size
+
+        # This list will hold the posts data of the current chunk.
+        self.data_list = list()
+
+        self.runs = list()
+        self.count = 0
+
+        # The keys of the posts of the current chunk, used to drop duplicates.
+        # The ids of the posts saved by previous runs are in the id index instead.
+        self.seen = set()
+        self.index = id_index.load(known) if known else None
+
+    def add(self, item):
+        """
+        This function adds a post from the Pushshift API. It returns True when
+        the chunk is full, then it has to be saved with save().
+        """
 
-        # We extract the values and prevent crashes for non-existing ones.
-        timestamp = item["created_utc"]
-        author = item.get("author", "")
-        title = item.get("title", "")
-        permalink = item.get("permalink", "")
+        row = to_row(item)
 
-        if permalink != "":
-            permalink = "https://www.reddit.com" + permalink
+        # We only keep the posts inside the window, this way a post at the border
+        # of two windows is never saved twice.
+        if not self.since <= row[0] < self.until:
+            return False
 
-        # We convert he date from a timestamp to ISO format.
-        isodate = f"{datetime.fromtimestamp(timestamp):%F %T}"
+        key = row_key(row)
 
-        data_list.append([isodate, author, title, permalink])
+        if key not in self.seen:
+            self.seen.add(key)
+            self.data_list.append(row)
 
-    # We save the data list to a CSV file.
-    with open(f"{SUBREDDIT}-{YEAR}.csv", "w", newline="", encoding="utf-8") as csv_file:
-        csv.writer(csv_file).writerows(sorted(data_list, reverse=True))
+        return len(self.data_list) >= self.chunk_size
+
+    def save(self):
+        """
+        This function saves the current chunk as a sorted run.
+        """
+
+        self.data_list = drop_known(self.data_list, self.index)
+
+        if self.data_list:
+            self.runs.append(save_run(self.data_list, self.folder, f"{self.since}-{len(self.runs)}"))
+            self.count += len(self.data_list)
+
+        self.data_list = list()
+        self.seen = set()
+
+    def close(self):
+        """
+        This function saves the last chunk and returns the names of the runs and their number of rows.
+        """
+
+        self.save()
+
+        return self.runs, self.count
+
+
+def fetch(folder, since, args, previous=False, executor=None, tz=None):
+    """
+    This function downloads the posts and writes them to the output file.
+
+    The span is split in time windows which are downloaded by several worker processes
+    at the same time (pmaw has to run in the main thread of a process). The posts are
+    kept in memory in chunks of args.chunk_size rows, each chunk is saved as a sorted
+    run and at the end all the runs are merged (external merge sort).
+
+    After each window a checkpoint with the windows finished so far is written to
+    the folder, if the folder already has a checkpoint we continue from it. A checkpoint
+    made for another 'since', or one marked as finished (its posts may already be in
+    the output file), is discarded.
+
+    It returns the counts by hour of the year of the new posts (None for the sqlite format),
+    in the timezone tz if the file has UTC epochs.
+    """
+
+    checkpoint = load_checkpoint(folder)
+
+    # In update mode 'since' comes from the output file, if it changed the file was
+    # already written with the posts of the checkpoint and we would add them twice.
+    if checkpoint is not None and (checkpoint.get("since") != since or checkpoint.get("finished")):
+        print("Discarding the checkpoint of a previous download")
+
+        shutil.rmtree(folder)
+        os.makedirs(folder)
+
+        checkpoint = None
+
+    if checkpoint is None:
+        checkpoint = {"since": since, "done": [], "runs": [], "count": 0}
+    else:
+        print(f"Resuming, {len(checkpoint['done'])} windows already downloaded")
+
+    windows = [window for window in time_windows(since, year_epochs(args.yr)[1], args.window)
+               if window[0] not in checkpoint["done"]]
+
+    # In update mode the posts we already have are dropped by the workers.
+    index = id_index.index_path(output_path(args, f".{args.format}"))
+    known = index if previous and args.format != "sqlite" else None
+
+    with stage("fetch") as record:
+        if args.engine == "async":
+            # All the windows are downloaded by this process, the stats of the requests are saved.
+            metrics = asyncio.run(fetch_windows_async(folder, windows, checkpoint, args, known))
+            record.update(metrics)
+
+            print(f"{metrics['requests']:,} requests ({metrics['retries']:,} retries, "
+                  f"{metrics['throttled']:,} throttled), {metrics['items_per_second']:,} posts per second")
+        elif executor is None:
+            with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+                fetch_windows(folder, windows, checkpoint, args, executor, known)
+        else:
+            fetch_windows(folder, windows, checkpoint, args, executor, known)
+
+        record["rows"] = checkpoint["count"]
+
+    # From here on the output may get the new posts, if we are interrupted
+    # the next run discards the checkpoint instead of adding them again.
+    checkpoint["finished"] = True
+    save_checkpoint(folder, checkpoint)
+
+    # The database has its own index, we only insert the rows in it.
+    if args.format == "sqlite":
+        with stage("insert", checkpoint["count"]) as record:
+            record["inserted"] = store.insert(db_path(args), args.r, merge_runs(folder, checkpoint["runs"]))
+
+        return None
+
+    # We save the merged runs, sorted from newest to oldest.
+    # The merge, the date formatting and the writing happen in this single stage.
+    # The ids are taken out of the rows on the way and saved in the id index.
+    ids = np.zeros(checkpoint["count"], dtype=np.int64)
+
+    # The counts of the file are in UTC, for another timezone we also keep the epochs.
+    # The ISO dates are already in local time, like for dataset.load_hourly().
+    if tz not in (None, "UTC") and (args.epoch or args.format == "npy"):
+        epochs = np.zeros(checkpoint["count"], dtype=np.int64)
+    else:
+        epochs = None
+
+    with stage("merge_write", checkpoint["count"]):
+        rows = split_ids(merge_runs(folder, checkpoint["runs"]), ids, epochs)
+
+        if args.format == "npy":
+            hourly = write_npy(rows, checkpoint["count"], args, previous)
+        else:
+            hourly = write_csv(rows, args, previous)
+
+    with stage("rollup"):
+        update_rollup(hourly, args, previous)
+
+    with stage("id_index", len(ids)):
+        id_index.save(index, ids, id_index.load(index) if previous else None)
+
+    # The unused items of the epochs (duplicates dropped by the merge) are 0, they are ignored.
+    if epochs is not None:
+        return count_hours(to_local(epochs, tz), args.yr)
+
+    return np.asarray(hourly, dtype=np.int64)
+
+
+def fetch_windows(folder, windows, checkpoint, args, executor, known=None):
+    """
+    This function downloads the time windows in the worker processes of the executor.
+    """
+
+    futures = {executor.submit(fetch_window, folder, *window, args, known): window
+               for window in windows}
+
+    # The checkpoint is only updated from this process, as the windows finish.
+    for future in as_completed(futures):
+        runs, count, stages = future.result()
+
+        instrument.STAGES.extend(stages)
+
+        checkpoint["done"].append(futures[future][0])
+        checkpoint["runs"].extend(runs)
+        checkpoint["count"] += count
+
+        save_checkpoint(folder, checkpoint)
+
+
+async def fetch_windows_async(folder, windows, checkpoint, args, known=None):
+    """
+    This function downloads the time windows with the asyncio engine of fetcher.py.
+    It returns the stats of the requests.
+
+    At most args.jobs windows are downloaded at the same time, all of them share
+    the same connections and rate limit.
+    """
+
+    client = fetcher.Client(args.endpoint, args.rate_limit, args.jobs, args.retries)
+    slots = asyncio.Semaphore(args.jobs)
+
+    async def fetch_window_async(since, until):
+        async with slots:
+            params = search_params(since, until, args)
+
+            def pages():
+                return client.search(args.r, since, until, params["filter"])
+
+            # The windows downloaded before are read from the response cache.
+            if args.no_cache:
+                gen = pages()
+            else:
+                gen = response_cache.search_pages(
+                    args.cache, {**params, "endpoint": args.endpoint}, pages,
+                    args.cache_ttl, args.cache_size * 1024 * 1024)
+
+            window = WindowWriter(folder, since, until, args, known)
+
+            # Sorting and writing a chunk would stop the other downloads,
+            # so it is done in a thread while the event loop keeps running.
+            async for page in gen:
+                for item in page:
+                    if window.add(item):
+                        await asyncio.to_thread(window.save)
+
+            runs, count = await asyncio.to_thread(window.close)
+
+        # The checkpoint is only updated from this process, as the windows finish.
+        checkpoint["done"].append(since)
+        checkpoint["runs"].extend(runs)
+        checkpoint["count"] += count
+
+        save_checkpoint(folder, checkpoint)
+
+    try:
+        await asyncio.gather(*[fetch_window_async(*window) for window in windows])
+    finally:
+        client.close()
+
+    return client.metrics.summary()
 
 
 if __name__ == "__main__":
 
-    main()
+    args = arg.parse_args()
+
+    if args.timings or args.profile:
+        instrument.enable(args.profile)
+
+    main(args)
+
+    if args.timings:
+        instrument.save(args.timings, script="scraper", args=vars(args))
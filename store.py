@@ -0,0 +1,163 @@
+"""
+This module keeps the posts of many subreddits and years in a single
+SQLite database, it is used by scraper.py with -f sqlite and by
+plotter.py with --db.
+
+The posts are indexed by subreddit and date, so the counts of any time
+span are computed by SQLite with a GROUP BY query instead of reading files.
+"""
+
+import sqlite3
+
+import numpy as np
+
+from dataset import HOUR, aggregate_range, to_local
+from instrument import stage
+
+
+# Number of rows inserted in each transaction.
+BATCH_SIZE = 10_000
+
+# The counts are grouped in 15 minute buckets, this way they can be moved to the
+# timezone of the plots exactly, even the ones with offsets like +05:45.
+BUCKET = 900
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER,
+    subreddit TEXT NOT NULL COLLATE NOCASE,
+    created_utc INTEGER NOT NULL,
+    author TEXT,
+    title TEXT,
+    permalink TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS submissions_id ON submissions (subreddit, id);
+CREATE INDEX IF NOT EXISTS submissions_date ON submissions (subreddit, created_utc);
+"""
+
+
+def connect(path):
+    """
+    This function opens the database and creates the table if needed.
+
+    WAL mode lets plotter.py read the database while scraper.py is writing to it.
+    """
+
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=NORMAL")
+    connection.executescript(SCHEMA)
+
+    return connection
+
+
+def insert(path, subreddit, rows, batch_size=BATCH_SIZE):
+    """
+    This function saves the rows of scraper.py (date, author, title, permalink and id)
+    and returns the number of new rows.
+
+    The rows are inserted in batches, each one in its own transaction. The posts
+    already in the database (same subreddit and id) are skipped.
+    """
+
+    connection = connect(path)
+    inserted = 0
+
+    try:
+        batch = list()
+
+        for timestamp, author, title, permalink, post_id in rows:
+            # Posts without an id are saved with NULL, so they are never seen as duplicates.
+            batch.append((post_id or None, subreddit, timestamp, author, title, permalink))
+
+            if len(batch) >= batch_size:
+                inserted += insert_batch(connection, batch)
+                batch = list()
+
+        if batch:
+            inserted += insert_batch(connection, batch)
+    finally:
+        connection.close()
+
+    return inserted
+
+
+def insert_batch(connection, batch):
+    """
+    This function inserts a batch of rows in a single transaction.
+    """
+
+    with connection:
+        cursor = connection.executemany(
+            "INSERT OR IGNORE INTO submissions (id, subreddit, created_utc, author, title, permalink) "
+            "VALUES (?, ?, ?, ?, ?, ?)", batch)
+
+    return cursor.rowcount
+
+
+def newest_timestamp(path, subreddit, since, until):
+    """
+    This function returns the date of the newest post of the subreddit between since and until
+    (epochs), or None if there are no posts.
+    """
+
+    connection = connect(path)
+
+    try:
+        (newest,) = connection.execute(
+            "SELECT MAX(created_utc) FROM submissions "
+            "WHERE subreddit = ? AND created_utc >= ? AND created_utc < ?",
+            (subreddit, since, until)).fetchone()
+    finally:
+        connection.close()
+
+    return newest
+
+
+def count_hours(path, subreddit, since, until, tz=None):
+    """
+    This function returns the counts by hour of the posts of the subreddit between
+    the since and until dates (both included) in the specified timezone.
+
+    SQLite counts the posts in 15 minute buckets using the (subreddit, created_utc)
+    index, we then move the buckets to the timezone and add them up by hour.
+    """
+
+    first = np.datetime64(since, "D")
+    last = np.datetime64(until, "D") + 1
+
+    start = int(first.astype("datetime64[s]").astype(np.int64))
+    end = int(last.astype("datetime64[s]").astype(np.int64))
+
+    connection = connect(path)
+
+    # The timezones are at most 14 hours away from UTC, we ask for a day more on each side.
+    try:
+        buckets = connection.execute(
+            "SELECT created_utc / ? AS bucket, COUNT(*) FROM submissions "
+            "WHERE subreddit = ? AND created_utc >= ? AND created_utc < ? GROUP BY bucket",
+            (BUCKET, subreddit, start - 86400, end + 86400)).fetchall()
+    finally:
+        connection.close()
+
+    buckets = np.array(buckets, dtype=np.int64).reshape(-1, 2)
+
+    local = to_local(buckets[:, 0] * BUCKET, tz)
+    inside = (local >= start) & (local < end)
+
+    return np.bincount((local[inside] - start) // HOUR, weights=buckets[inside, 1],
+                       minlength=(end - start) // HOUR).astype(np.int64)
+
+
+def load_totals(path, subreddit, since, until, tz=None):
+    """
+    This function returns the totals used by the plots for the posts of the
+    subreddit between the since and until dates (both included).
+    """
+
+    with stage("query_hours") as record:
+        hourly = count_hours(path, subreddit, since, until, tz)
+        record["rows"] = int(hourly.sum())
+
+    with stage("aggregate", int(hourly.sum())):
+        return aggregate_range(hourly, since)
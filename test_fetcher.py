@@ -0,0 +1,120 @@
+"""
+Tests of the asyncio download engine (fetcher.py) against the mock server.
+
+    $ python -m pytest -q
+"""
+
+import asyncio
+import random
+import socket
+import time
+
+import pytest
+
+import fetcher
+from mock_pushshift import generate_posts
+
+
+def download(url, **options):
+    """
+    This function downloads all the posts of the mock server and returns them with the metrics.
+    """
+
+    async def run():
+        client = fetcher.Client(url, **options)
+        items = list()
+
+        try:
+            async for page in client.search("Test", 0, 2**40, ["id"]):
+                items.extend(page)
+        finally:
+            client.close()
+
+        return items, client.metrics
+
+    return asyncio.run(run())
+
+
+def test_bucket_halves_and_recovers():
+
+    bucket = fetcher.TokenBucket(600)
+
+    bucket.throttle()
+    assert bucket.rate == pytest.approx(5)
+
+    bucket.throttle()
+    assert bucket.rate == pytest.approx(2.5)
+
+    # The rate never goes below 1/32 of the limit.
+    for _ in range(10):
+        bucket.throttle()
+
+    assert bucket.rate == pytest.approx(10 / 32)
+
+    # Each success adds 1/20 of the limit, up to the limit.
+    bucket.succeed()
+    assert bucket.rate == pytest.approx(10 / 32 + 0.5)
+
+    for _ in range(30):
+        bucket.succeed()
+
+    assert bucket.rate == pytest.approx(10)
+
+
+def test_bucket_pauses_when_told():
+
+    bucket = fetcher.TokenBucket(6000)
+    bucket.throttle(retry_after=0.5)
+
+    start = time.monotonic()
+    asyncio.run(bucket.acquire())
+
+    assert time.monotonic() - start >= 0.45
+
+
+def test_failed_requests_are_retried(pushshift):
+
+    # The mock server picks the failed requests with the random module.
+    random.seed(3)
+    url, _ = pushshift(generate_posts("Test", 2021, 1000), fail_rate=0.3)
+
+    items, metrics = download(url, rate_limit=60_000, concurrency=2, retries=20)
+
+    ids = [item["id"] for item in items]
+    timestamps = [item["created_utc"] for item in items]
+
+    assert len(ids) == len(set(ids)) == 1000
+    assert timestamps == sorted(timestamps, reverse=True)
+
+    assert metrics.retries > 0
+    assert metrics.retries == metrics.throttled + metrics.errors
+    assert metrics.requests == 11 + metrics.retries
+
+
+def test_retries_are_limited(pushshift):
+
+    url, _ = pushshift(generate_posts("Test", 2021, 10), fail_rate=1.0)
+
+    with pytest.raises(fetcher.RetryableError):
+        download(url, rate_limit=60_000, retries=2)
+
+
+def test_timeout_is_retried(monkeypatch):
+
+    monkeypatch.setattr(fetcher, "TIMEOUT", 0.2)
+
+    # This server accepts the connections but never answers.
+    with socket.socket() as server:
+        server.bind(("localhost", 0))
+        server.listen()
+
+        client = fetcher.Client(f"http://localhost:{server.getsockname()[1]}", rate_limit=60_000, retries=1)
+
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(client.get_json("/reddit/submission/search", {}))
+
+        client.close()
+
+    assert client.metrics.requests == 2
+    assert client.metrics.retries == 1
+    assert client.metrics.errors == 2
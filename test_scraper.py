@@ -0,0 +1,177 @@
+"""
+Tests of scraper.py against the mock server of mock_pushshift.py.
+
+    $ python -m pytest -q
+"""
+
+import csv
+import os
+from datetime import datetime
+
+import pytest
+
+import scraper
+from dataset import REDDIT_URL, load_hourly
+from mock_pushshift import base36, generate_posts
+
+
+def scrape(url, folder, *options):
+    """
+    This function runs the scraper for r/Test in 2021 with a CSV file of epochs.
+    """
+
+    return scraper.main(scraper.arg.parse_args(
+        ["-r", "Test", "-yr", "2021", "-o", str(folder), "--endpoint", url,
+         "--epoch", "--no-cache", "--rate-limit", "60000", *options]))
+
+
+def read_posts(folder):
+    """
+    This function returns the epochs and the permalinks of the saved posts, in the order of the file.
+    """
+
+    with open(os.path.join(folder, "Test-2021.csv"), newline="", encoding="utf-8") as csv_file:
+        return [(int(row[0]), row[3]) for row in list(csv.reader(csv_file))[1:]]
+
+
+def expected_posts(posts):
+    """
+    This function returns the permalinks of the posts the scraper should save,
+    all the posts of 2021 (in local time, like the scraper).
+    """
+
+    start = int(datetime(2021, 1, 1).timestamp())
+    end = int(datetime(2022, 1, 1).timestamp())
+
+    return {REDDIT_URL + post["permalink"] for post in posts if start <= post["created_utc"] < end}
+
+
+def serve(handler, posts):
+    """
+    This function changes the posts of a running mock server.
+    """
+
+    handler.posts = sorted(posts, key=lambda post: post["created_utc"])
+    handler.timestamps = [post["created_utc"] for post in handler.posts]
+
+
+def check_posts(folder, posts):
+    """
+    This function checks that every post is saved once, from newest to oldest.
+    """
+
+    saved = read_posts(folder)
+    timestamps = [timestamp for timestamp, _ in saved]
+    permalinks = [permalink for _, permalink in saved]
+
+    assert timestamps == sorted(timestamps, reverse=True)
+    assert len(permalinks) == len(set(permalinks))
+    assert set(permalinks) == expected_posts(posts)
+
+    # The rollup has the counts of the same posts.
+    assert load_hourly(os.path.join(folder, "Test-2021.csv"), 2021).sum() == len(saved)
+
+
+@pytest.mark.parametrize("engine", ["pmaw", "async"])
+def test_posts_are_saved_once(pushshift, tmp_path, engine):
+
+    posts = generate_posts("Test", 2021, 3000)
+    url, _ = pushshift(posts)
+
+    scrape(url, tmp_path, "--engine", engine, "-w", "week", "-j", "2")
+
+    check_posts(tmp_path, posts)
+
+
+def test_window_boundaries(pushshift, tmp_path):
+
+    posts = generate_posts("Test", 2021, 500)
+
+    # A few posts in the first and the last second of each window.
+    for number, (since, until) in enumerate(scraper.time_windows(*scraper.year_epochs(2021), "day")):
+        for offset, timestamp in enumerate([since, since, since, until - 1]):
+            post_id = base36(20_000_000 + number * 4 + offset)
+
+            posts.append({
+                "id": post_id,
+                "created_utc": timestamp,
+                "author": "boundary",
+                "title": f"Boundary {number}-{offset}",
+                "permalink": f"/r/Test/comments/{post_id}/boundary/"
+            })
+
+    url, _ = pushshift(posts)
+
+    scrape(url, tmp_path, "--engine", "async", "-w", "day")
+
+    check_posts(tmp_path, posts)
+
+
+def test_duplicates_in_other_chunks(pushshift, tmp_path):
+
+    # Each post is returned twice, the copies often end in different chunks.
+    posts = generate_posts("Test", 2021, 1000)
+    url, _ = pushshift(posts + [dict(post) for post in posts])
+
+    scrape(url, tmp_path, "--engine", "async", "--chunk-size", "7")
+
+    check_posts(tmp_path, posts)
+
+
+def test_interrupted_run_resumes(pushshift, tmp_path, monkeypatch, capsys):
+
+    posts = generate_posts("Test", 2021, 3000)
+    url, _ = pushshift(posts)
+
+    save_checkpoint = scraper.save_checkpoint
+
+    # The run stops after the checkpoint of the third window is saved.
+    def interrupted(folder, checkpoint):
+        save_checkpoint(folder, checkpoint)
+
+        if len(checkpoint["done"]) == 3:
+            raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(scraper, "save_checkpoint", interrupted)
+
+    with pytest.raises(RuntimeError):
+        scrape(url, tmp_path, "--engine", "async", "-j", "1", "-k")
+
+    assert os.path.exists(tmp_path / "Test-2021.parts" / "checkpoint.json")
+    assert not os.path.exists(tmp_path / "Test-2021.csv")
+
+    monkeypatch.setattr(scraper, "save_checkpoint", save_checkpoint)
+
+    scrape(url, tmp_path, "--engine", "async", "-j", "1", "-k")
+
+    assert "Resuming, 3 windows already downloaded" in capsys.readouterr().out
+    assert not os.path.exists(tmp_path / "Test-2021.parts")
+
+    check_posts(tmp_path, posts)
+
+
+def test_interrupted_update_is_not_repeated(pushshift, tmp_path, monkeypatch):
+
+    posts = generate_posts("Test", 2021, 3000)
+    url, handler = pushshift(posts[:2000])
+
+    scrape(url, tmp_path, "--engine", "async", "-k")
+
+    # The update stops after the data file is replaced, before the rollup and the id index.
+    serve(handler, posts)
+
+    def interrupted(*args):
+        raise RuntimeError("interrupted")
+
+    monkeypatch.setattr(scraper, "update_rollup", interrupted)
+
+    with pytest.raises(RuntimeError):
+        scrape(url, tmp_path, "--engine", "async", "-k", "-u")
+
+    monkeypatch.undo()
+
+    hourly = scrape(url, tmp_path, "--engine", "async", "-k", "-u")
+
+    assert hourly.sum() == 0
+
+    check_posts(tmp_path, posts)
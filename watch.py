@@ -0,0 +1,223 @@
+"""
+This script keeps the data and the plots of some subreddits up to date,
+it runs until it is stopped with Ctrl+C.
+
+    $ python watch.py Python learnpython -o reports -i 600
+
+Every cycle it downloads only the posts newer than the ones already saved
+(like scraper.py -u) and adds their counts to the ones kept in memory. Only
+the plots whose counts changed are created again, and the libraries and the
+kaleido instances are started once for the whole session.
+
+The posts of the current year are used, each subreddit is saved in its
+own folder (e.g. reports/Python-2021/) like in batch.py.
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import plotter
+import scraper
+from dataset import aggregate, find_data, load_hourly
+
+
+# argparse object creation
+arg = argparse.ArgumentParser(description="Keeps subreddits data and plots up to date")
+arg.add_argument("subreddits",
+                 nargs="+",
+                 help=" names of the subreddits")
+arg.add_argument("-yr", "--yr",
+                 type=int,
+                 default=None,
+                 help=" year to follow, the current one by default (it changes on New Year)")
+arg.add_argument("-i", "--interval",
+                 type=int,
+                 default=900,
+                 help=" seconds between the start of each cycle")
+arg.add_argument("-n", "--cycles",
+                 type=int,
+                 default=0,
+                 help=" stops after this many cycles, 0 runs until stopped")
+arg.add_argument("-o", "--output",
+                 type=str,
+                 default="reports",
+                 help=" folder where the folders of the subreddits are created")
+arg.add_argument("-j", "--workers",
+                 type=int,
+                 default=4,
+                 help=" number of worker processes used to download and to export the images")
+arg.add_argument("-p", "--plots",
+                 nargs="+",
+                 choices=["calendar", "radar", "bars", "donut", "heatmap"],
+                 default=["calendar", "radar", "bars", "donut"],
+                 help=" plots to keep up to date")
+arg.add_argument("-f", "--format",
+                 choices=["csv", "npy"],
+                 default="csv",
+                 help=" format of the data files")
+arg.add_argument("-w", "--window",
+                 choices=["month", "week", "day"],
+                 default="month",
+                 help=" size of the time windows the new posts are downloaded in")
+arg.add_argument("--epoch",
+                 action="store_true",
+                 help=" saves the created_utc epochs instead of ISO dates in the CSV files")
+arg.add_argument("--tz",
+                 type=str,
+                 default="UTC",
+                 help=" timezone of the plots, needs --epoch or -f npy (the ISO dates are in the local time of the scraper)")
+arg.add_argument("--rate-limit",
+                 type=int,
+                 default=60,
+                 help=" maximum number of requests per minute")
+arg.add_argument("--engine",
+                 choices=["pmaw", "async"],
+                 default="pmaw",
+                 help=" download engine of the scraper")
+arg.add_argument("--endpoint",
+                 type=str,
+                 default=None,
+                 help=" base URL of a Pushshift compatible server")
+
+
+class Watcher:
+    """
+    This class keeps the hourly counts of a subreddit and the totals of the last
+    plots created, so each cycle only does the work of the new posts.
+    """
+
+    def __init__(self, subreddit, args):
+        self.subreddit = subreddit
+        self.args = args
+        self.year = None
+        self.hourly = None
+        self.rendered = dict()
+
+    def scrape(self, year, scrape_executor):
+        """
+        This function downloads the new posts and returns their counts by hour,
+        in the timezone of the plots.
+        """
+
+        # Each cycle asks for a different span (since the newest post), a cached response
+        # would never be read again, so the response cache is not used.
+        options = ["-r", self.subreddit, "-yr", str(year), "-o", self.folder(year), "-u",
+                   "-f", self.args.format, "-w", self.args.window, "-j", str(self.args.workers),
+                   "--rate-limit", str(self.args.rate_limit), "--engine", self.args.engine,
+                   "--no-cache"]
+
+        if self.args.epoch:
+            options.append("--epoch")
+
+        if self.args.endpoint:
+            options.extend(["--endpoint", self.args.endpoint])
+
+        return scraper.main(scraper.arg.parse_args(options), scrape_executor, self.args.tz)
+
+    def folder(self, year):
+        """
+        This function returns the folder of the data and the plots of a year.
+        """
+
+        return os.path.join(self.args.output, f"{self.subreddit}-{year}")
+
+    def refresh(self, year, scrape_executor, plot_executor):
+        """
+        This function runs a cycle and returns the number of new posts and the plots created again.
+        """
+
+        delta = self.scrape(year, scrape_executor)
+
+        # The counts of the scraper are in the timezone of the plots, so we add them to ours.
+        # The first cycle of a year reads the rollup (or the file).
+        if year != self.year:
+            self.year = year
+            self.hourly = load_hourly(find_data(self.subreddit, year, self.folder(year)), year, self.args.tz)
+            self.rendered = dict()
+        else:
+            self.hourly = self.hourly + delta
+
+        totals = aggregate(self.hourly, year)
+
+        # A plot is only created again if its totals are not the same as the last time.
+        changed = list()
+
+        for name in self.args.plots:
+            key = plotter.PLOTS[name][1]
+
+            if name not in self.rendered or not self.rendered[name].equals(totals[key]):
+                changed.append(name)
+
+        if changed:
+            folder = self.folder(year)
+
+            plot_args = plotter.arg.parse_args(
+                ["-r", self.subreddit, "-yr", str(year), "-d", folder, "-o", folder,
+                 "-j", str(self.args.workers), "--tz", self.args.tz, "-p", *changed])
+
+            plotter.render(totals, plot_args, plot_executor)
+
+            for name in changed:
+                self.rendered[name] = totals[plotter.PLOTS[name][1]]
+
+        return int(delta.sum()), changed
+
+
+def main(args):
+
+    os.makedirs(args.output, exist_ok=True)
+
+    watchers = [Watcher(subreddit, args) for subreddit in args.subreddits]
+    cycle = 0
+
+    # Both pools live for the whole session, the plot workers keep kaleido running between cycles.
+    with ProcessPoolExecutor(max_workers=args.workers) as scrape_executor, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=plotter.start_worker) as plot_executor:
+
+        try:
+            while True:
+                start = time.monotonic()
+                year = args.yr or datetime.now().year
+
+                for watcher in watchers:
+                    cycle_start = time.perf_counter()
+
+                    # A failed subreddit is reported and tried again in the next cycle.
+                    try:
+                        new, changed = watcher.refresh(year, scrape_executor, plot_executor)
+                        message = f"{new:,} new posts, {len(changed)} plots updated"
+                    except Exception as exc:
+                        message = f"failed: {type(exc).__name__}: {exc}"
+
+                        # The counts in memory may have missed some posts, they are read again from the files.
+                        watcher.year = None
+
+                    seconds = time.perf_counter() - cycle_start
+
+                    print(f"[{datetime.now():%F %T}] r/{watcher.subreddit} {year}: {message} ({seconds:,.1f}s)")
+
+                cycle += 1
+
+                if cycle == args.cycles:
+                    break
+
+                time.sleep(max(0, args.interval - (time.monotonic() - start)))
+        except KeyboardInterrupt:
+            print("Stopped")
+
+    return 0
+
+
+if __name__ == "__main__":
+
+    args = arg.parse_args()
+
+    # The ISO dates are in the local time of the scraper, they can't be converted to another timezone.
+    if args.tz != "UTC" and args.format == "csv" and not args.epoch:
+        arg.error("--tz needs UTC epochs in the data files, pass --epoch or -f npy")
+
+    sys.exit(main(args))